@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CategoriesConfig(AppConfig):
     name = 'categories'
+
+    def ready(self):
+        from categories.snapshot import load_snapshot
+        load_snapshot()
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    # In-process tier. Entries expire after LOCAL_TIMEOUT seconds so that
+    # invalidations made by other processes are picked up eventually.
+    'LRU_SIZE': 1024,
+    'LOCAL_TIMEOUT': 5,
+    # Shared tier: an alias from settings.CACHES, or None to disable it.
+    'BACKEND': 'default',
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'categories:detail:',
+}
+
+
+class LRUCache:
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires, value = self.entries[key]
+            except KeyError:
+                return None
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CategoryCache:
+    """Two-tier read-through cache for category detail payloads."""
+
+    def __init__(self, options):
+        self.options = options
+        self.local = LRUCache(options['LRU_SIZE'], options['LOCAL_TIMEOUT'])
+        alias = options['BACKEND']
+        self.shared = caches[alias] if alias else None
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0,
+                         'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def key(self, pk):
+        return '{}{}'.format(self.options['KEY_PREFIX'], pk)
+
+    def get(self, pk):
+        data = self.local.get(pk)
+        if data is not None:
+            self.count('local_hits')
+            return data
+        if self.shared is not None:
+            data = self.shared.get(self.key(pk))
+            if data is not None:
+                self.local.set(pk, data)
+                self.count('shared_hits')
+                return data
+        self.count('misses')
+        return None
+
+    def set(self, pk, data):
+        self.local.set(pk, data)
+        if self.shared is not None:
+            self.shared.set(self.key(pk), data, self.options['TIMEOUT'])
+
+    def invalidate(self, pks):
+        pks = set(pks)
+        for pk in pks:
+            self.local.delete(pk)
+        if self.shared is not None:
+            self.shared.delete_many([self.key(pk) for pk in pks])
+        self.count('invalidations', len(pks))
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] += value
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['hits'] = stats['local_hits'] + stats['shared_hits']
+        stats['local_size'] = len(self.local)
+        return stats
+
+
+_cache = None
+
+
+def get_category_cache():
+    """Return the configured cache, or None when caching is disabled."""
+    global _cache
+    options = dict(DEFAULTS, **getattr(settings, 'CATEGORIES_CACHE', {}))
+    if not options['ENABLED']:
+        return None
+    if _cache is None:
+        _cache = CategoryCache(options)
+    return _cache
+
+
+def invalidate_categories(pks):
+    cache = get_category_cache()
+    if cache is not None:
+        cache.invalidate(pks)
+
+
+def reset_category_cache(*args, **kwargs):
+    global _cache
+    if kwargs.get('setting') in (None, 'CATEGORIES_CACHE', 'CACHES'):
+        _cache = None
+
+
+setting_changed.connect(reset_category_cache)
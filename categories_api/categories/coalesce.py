@@ -0,0 +1,127 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+
+from categories.tree import create_tree
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Longest a batch waits for more requests before it is written.
+    'MAX_WAIT_MS': 5,
+    'MAX_BATCH': 50,
+}
+
+
+class PendingCreate:
+    def __init__(self, root):
+        self.root = root
+        self.wake = threading.Event()
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class WriteCoalescer:
+    """Group commit of concurrent ``create_tree`` calls in one process.
+
+    The first waiting request leads: it collects the requests arriving
+    within ``MAX_WAIT_MS`` (up to ``MAX_BATCH``), writes each in its own
+    savepoint of a single transaction and hands every caller its category
+    or error. Requests queued meanwhile wait for the next leader, so only
+    one transaction per process contends for the SQLite write lock.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.condition = threading.Condition()
+        self.queue = []
+        self.leader = None
+        self.batches = 0
+
+    def create_tree(self, root):
+        item = PendingCreate(root)
+        with self.condition:
+            self.queue.append(item)
+            if self.leader is None:
+                self.promote(item)
+            self.condition.notify_all()
+        item.wake.wait()
+        if not item.done:
+            self.lead()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def promote(self, item):
+        self.leader = item
+        item.wake.set()
+
+    def lead(self):
+        max_batch = self.options['MAX_BATCH']
+        deadline = time.monotonic() + self.options['MAX_WAIT_MS'] / 1000
+        with self.condition:
+            while len(self.queue) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.queue[:max_batch]
+            del self.queue[:max_batch]
+        try:
+            self.apply(batch)
+        finally:
+            with self.condition:
+                self.batches += 1
+                self.leader = None
+                if self.queue:
+                    self.promote(self.queue[0])
+            for item in batch:
+                item.done = True
+                item.wake.set()
+
+    @staticmethod
+    def apply(batch):
+        try:
+            with transaction.atomic():
+                for item in batch:
+                    try:
+                        # Rolls back only this request's writes on error.
+                        with transaction.atomic():
+                            item.result = create_tree(item.root)
+                    except Exception as e:
+                        item.error = e
+        except Exception as e:
+            # The commit itself failed, so nothing was written.
+            for item in batch:
+                if item.error is None:
+                    item.result, item.error = None, e
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_write_coalescer():
+    """Return the process-wide coalescer, or None when it is disabled."""
+    global _coalescer
+    options = dict(DEFAULTS,
+                   **getattr(settings, 'CATEGORIES_WRITE_COALESCING', {}))
+    if not options['ENABLED']:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = WriteCoalescer(options)
+    return _coalescer
+
+
+def reset_write_coalescer(*args, **kwargs):
+    global _coalescer
+    if kwargs.get('setting') in (None, 'CATEGORIES_WRITE_COALESCING'):
+        _coalescer = None
+
+
+setting_changed.connect(reset_write_coalescer)
@@ -0,0 +1,200 @@
+"""Concurrent load generator for the categories API.
+
+Drives ``categories_api.wsgi.application`` in-process, or a server at a
+base URL, from a thread or process pool with a mix of tree creates and
+detail retrieves. Used by the ``load_test`` command.
+"""
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from wsgiref.util import setup_testing_defaults
+
+from django.core.signals import got_request_exception
+from django.db import connections
+
+
+API_PREFIX = '/api/'
+
+LOCK_MESSAGES = (b'database is locked', b'database table is locked')
+
+_application = None
+_state = threading.local()
+
+
+def get_application():
+    global _application
+    if _application is None:
+        from categories_api.wsgi import application
+        got_request_exception.connect(note_exception)
+        _application = application
+    return _application
+
+
+def note_exception(sender, request=None, **kwargs):
+    # Called from the handler's except block, so the exception is current.
+    _state.exception = sys.exc_info()[1]
+
+
+def wsgi_request(method, path, body=None):
+    """Call the WSGI app directly; returns ``(status, body, locked)``."""
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path}
+    if '?' in path:
+        environ['PATH_INFO'], environ['QUERY_STRING'] = path.split('?', 1)
+    if body is not None:
+        environ['CONTENT_TYPE'] = 'application/json'
+        environ['CONTENT_LENGTH'] = str(len(body))
+    setup_testing_defaults(environ)
+    if body is not None:
+        environ['wsgi.input'].write(body)
+        environ['wsgi.input'].seek(0)
+    started = []
+    _state.exception = None
+    response = get_application()(
+        environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        content = b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    exception = _state.exception
+    locked = exception is not None and is_lock_error(
+        str(exception).encode('utf-8'))
+    return int(started[0].split()[0]), content, locked
+
+
+def http_request(base_url, method, path, body=None):
+    """Send a request to a running server; returns ``(status, body,
+    locked)``. Lock errors are only recognised from DEBUG error pages."""
+    request = Request(base_url.rstrip('/') + path, data=body, method=method)
+    if body is not None:
+        request.add_header('Content-Type', 'application/json')
+    try:
+        with urlopen(request) as response:
+            status, content = response.status, response.read()
+    except HTTPError as e:
+        status, content = e.code, e.read()
+    return status, content, status >= 500 and is_lock_error(content)
+
+
+def is_lock_error(content):
+    return any(message in content for message in LOCK_MESSAGES)
+
+
+def send(base_url, method, path, body=None):
+    if base_url:
+        return http_request(base_url, method, API_PREFIX + path, body)
+    return wsgi_request(method, API_PREFIX + path, body)
+
+
+def build_tree(prefix, size, branching=3):
+    """Breadth-first filled tree of ``size`` uniquely named categories."""
+    nodes = [{'name': '{} 0'.format(prefix)}]
+    for i in range(1, size):
+        kid = {'name': '{} {}'.format(prefix, i)}
+        nodes[(i - 1) // branching].setdefault('children', []).append(kid)
+        nodes.append(kid)
+    return nodes[0]
+
+
+def seed(base_url, run, trees, tree_size):
+    """Create ``trees`` trees through the API and return the ids of their
+    categories, found with the search endpoint."""
+    for i in range(trees):
+        body = json.dumps(build_tree('load {} seed {}'.format(run, i),
+                                     tree_size)).encode('utf-8')
+        status, content, _ = send(base_url, 'POST', 'categories/', body)
+        if status != 201:
+            raise RuntimeError('Seeding failed with {}: {}'.format(
+                status, content[:200]))
+    status, content, _ = send(
+        base_url, 'GET',
+        'categories/search/?q=load+{}+seed&limit=100'.format(run))
+    ids = [category['id'] for category in json.loads(content.decode())]
+    if not ids:
+        raise RuntimeError('Seeded categories weren\'t found by search.')
+    return ids
+
+
+def run_worker(base_url, run, worker, requests, write_ratio, tree_size, ids):
+    """Send ``requests`` mixed requests; returns ``(op, seconds, status,
+    locked)`` samples."""
+    rng = random.Random('{}-{}'.format(run, worker))
+    samples = []
+    for n in range(requests):
+        if rng.random() < write_ratio:
+            op, method, path = 'create', 'POST', 'categories/'
+            body = json.dumps(build_tree(
+                'load {} {} {}'.format(run, worker, n),
+                tree_size)).encode('utf-8')
+        else:
+            op, method, body = 'retrieve', 'GET', None
+            path = 'categories/{}/'.format(rng.choice(ids))
+        started = time.perf_counter()
+        status, _, locked = send(base_url, method, path, body)
+        samples.append((op, time.perf_counter() - started, status, locked))
+    if not base_url:
+        connections.close_all()
+    return samples
+
+
+def run_load(base_url=None, workers=4, processes=False, requests=200,
+             write_ratio=0.2, tree_size=10, seed_trees=5):
+    """Run the load and return ``(samples, seconds)``."""
+    run = uuid.uuid4().hex[:8]
+    ids = seed(base_url, run, seed_trees, tree_size)
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    per_worker = [requests // workers + (i < requests % workers)
+                  for i in range(workers)]
+    pool = (Pool if processes else ThreadPool)(workers)
+    try:
+        started = time.perf_counter()
+        results = pool.starmap(run_worker, [
+            (base_url, run, worker, count, write_ratio, tree_size, ids)
+            for worker, count in enumerate(per_worker)])
+        seconds = time.perf_counter() - started
+    finally:
+        pool.close()
+        pool.join()
+    return [sample for samples in results for sample in samples], seconds
+
+
+def percentile(values, q):
+    """Nearest-rank ``q`` quantile of sorted ``values``."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(samples, seconds):
+    """Throughput, latency percentiles in milliseconds, status counts and
+    lock errors, overall and per operation."""
+    report = {'seconds': round(seconds, 3)}
+    groups = [('all', samples)]
+    groups.extend((op, [s for s in samples if s[0] == op])
+                  for op in ('create', 'retrieve'))
+    for name, group in groups:
+        latencies = sorted(s[1] * 1000 for s in group)
+        report[name] = {
+            'requests': len(group),
+            'throughput': round(len(group) / seconds, 1) if seconds else None,
+            'p50': round_ms(percentile(latencies, 0.5)),
+            'p95': round_ms(percentile(latencies, 0.95)),
+            'p99': round_ms(percentile(latencies, 0.99)),
+            'statuses': dict(Counter(s[2] for s in group)),
+            'lock_errors': sum(1 for s in group if s[3]),
+        }
+    return report
+
+
+def round_ms(ms):
+    return None if ms is None else round(ms, 2)
@@ -0,0 +1,88 @@
+import gzip
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery
+
+from categories.models import Category
+
+
+class Command(BaseCommand):
+    help = ('Stream every category and its parent links as NDJSON that '
+            'import_categories reads back. Siblings are derived from '
+            'shared parents, so they need no records of their own.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Output file, stdout by default. Files '
+                                 'ending in .gz are compressed.')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Compress the output regardless of name.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        compress = options['gzip'] or path.endswith('.gz')
+        started = time.monotonic()
+        count = 0
+        if path == '-' and not compress:
+            for record in iter_records(options['chunk_size']):
+                self.stdout.write(record, ending='')
+                count += 1
+        else:
+            with open_output(path, compress) as out:
+                for record in iter_records(options['chunk_size']):
+                    out.write(record)
+                    count += 1
+        self.stderr.write('Exported {} records in {:.1f}s.'.format(
+            count, time.monotonic() - started))
+
+
+def open_output(path, compress):
+    if path == '-':
+        return gzip.open(sys.stdout.buffer, 'wt', encoding='utf-8')
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def iter_records(chunk_size):
+    """Yield one NDJSON line per category with its lowest-id parent, then
+    one per further parent link.
+
+    Categories come in ``depth`` order, which follows lowest-id parents,
+    so every parent is written before its kids and import_categories
+    creates each batch in bulk. Only the extra parents of multi-parent
+    categories are linked one by one after all names exist.
+    """
+    Kids = Category.kids.through
+    first_parents = (Kids.objects.filter(to_category_id=OuterRef('pk'))
+                     .order_by('from_category_id'))
+    categories = (Category.objects.order_by('depth', 'pk')
+                  .annotate(parent=Subquery(
+                      first_parents.values('from_category__name')[:1]))
+                  .values_list('name', 'parent')
+                  .iterator(chunk_size=chunk_size))
+    for name, parent in categories:
+        yield encode_record(
+            {'name': name} if parent is None else
+            {'name': name, 'parent': parent})
+    first_parent_ids = (Kids.objects
+                        .filter(to_category_id=OuterRef('to_category_id'))
+                        .order_by('from_category_id'))
+    links = (Kids.objects
+             .annotate(first_parent=Subquery(
+                 first_parent_ids.values('from_category_id')[:1]))
+             .exclude(from_category_id=F('first_parent'))
+             .order_by('pk')
+             .values_list('to_category__name', 'from_category__name')
+             .iterator(chunk_size=chunk_size))
+    for name, parent in links:
+        yield encode_record({'name': name, 'parent': parent})
+
+
+def encode_record(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
@@ -0,0 +1,296 @@
+import gzip
+import io
+import json
+import re
+import sys
+import time
+from collections import deque
+from itertools import islice
+from json.decoder import scanstring
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.serializers import ValidationError
+
+from categories.tree import merge_nodes, validate_children, validate_node
+
+
+READ_SIZE = 64 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Stream categories from NDJSON ({"name": ..., "parent": ...} per '
+            'line) or nested JSON trees into the database in batches. '
+            'Existing categories are linked rather than duplicated.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, "-" for stdin. Files '
+                                         'ending in .gz are decompressed.')
+        parser.add_argument('--format', choices=('ndjson', 'json'),
+                            help='Input format, guessed from the file name '
+                                 'by default (.json means nested JSON).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Records committed per transaction.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        input_format = options['format'] or guess_format(path)
+
+        with open_input(path) as stream:
+            if input_format == 'ndjson':
+                records = iter_ndjson_records(stream)
+            else:
+                records = iter_json_tree_records(stream)
+            self.import_records(records, batch_size)
+
+    def import_records(self, records, batch_size):
+        started = time.monotonic()
+        total = created = 0
+        batch_number = 0
+        while True:
+            try:
+                batch = list(islice(records, batch_size))
+            except (ValueError, ValidationError) as e:
+                raise CommandError('Bad input after {} records: {}'.format(
+                    total, error_detail(e)))
+            if not batch:
+                break
+            batch_number += 1
+            try:
+                _, new = merge_nodes(batch)
+            except ValidationError as e:
+                raise CommandError('Batch {} failed, {} records were already '
+                                   'committed: {}'.format(
+                                       batch_number, total, error_detail(e)))
+            total += len(batch)
+            created += len(new)
+            elapsed = time.monotonic() - started
+            self.stdout.write('{} records, {} created, {:.0f} rows/s'.format(
+                total, created, total / elapsed if elapsed else 0))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported {} records ({} new categories) in {:.1f}s.'.format(
+                total, created, time.monotonic() - started)))
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'json' if name.endswith('.json') else 'ndjson'
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def error_detail(error):
+    return getattr(error, 'detail', error)
+
+
+def iter_ndjson_records(stream):
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError('line {}: {}'.format(number, e))
+        name = validate_node(record)
+        parent = record.get('parent')
+        if parent is not None:
+            parent = validate_node({'name': parent})
+        yield name, parent
+
+
+class PendingNode:
+    """A node of a nested JSON tree whose record may still be waiting for
+    its own or an ancestor's name."""
+    __slots__ = ('parent', 'name', 'ready', 'waiting')
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.name = None
+        self.ready = False
+        self.waiting = []
+
+
+def iter_json_tree_records(stream):
+    """Yield ``(name, parent_name)`` records, parents first, from a nested
+    JSON tree or array of trees while it is being read.
+
+    Only the path to the current node is kept, plus the records of kids
+    that appear before their parent's ``"name"`` key.
+    """
+    events = iter_json_events(iter_json_tokens(stream))
+    event, _ = next(events, ('eof', None))
+    if event == 'start_map':
+        stack = [('node', PendingNode(None))]
+    elif event == 'start_array':
+        stack = [('children', None)]
+    else:
+        raise ValueError('expected a JSON object or array')
+
+    for event, value in events:
+        context, node = stack[-1]
+        if context == 'children':
+            if event == 'end_array':
+                stack.pop()
+            elif event == 'start_map':
+                stack.append(('node', PendingNode(node)))
+            else:
+                validate_node(value)
+            continue
+        if event == 'end_map':
+            if node.name is None:
+                validate_node({})
+            stack.pop()
+            continue
+        key = value
+        event, value = next(events)
+        if key == 'name':
+            if node.name is not None:
+                raise ValueError('"name" is given more than once')
+            node.name = validate_node(
+                {'name': value if event == 'value' else {}})
+            yield from resolve_node(node)
+        elif key == 'children' and event == 'start_array':
+            stack.append(('children', node))
+        else:
+            if key == 'children':
+                # An object is never a list, even an empty one.
+                validate_children(value if event == 'value' else True)
+            skip_value(events, event)
+
+
+def resolve_node(node):
+    """Yield the record of a newly named node once its parent's record
+    is out, followed by those of kids that were waiting for it."""
+    parent = node.parent
+    if parent is not None and not parent.ready:
+        parent.waiting.append(node)
+        return
+    queue = deque([node])
+    while queue:
+        node = queue.popleft()
+        yield node.name, node.parent.name if node.parent else None
+        node.ready = True
+        queue.extend(node.waiting)
+        node.waiting = []
+
+
+def skip_value(events, event):
+    depth = event in ('start_map', 'start_array')
+    while depth:
+        event, _ = next(events)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+
+
+TOKEN = re.compile(r"""
+    [ \t\r\n]*
+    (?:
+        (?P<punctuation>[{}\[\]:,])
+      | (?P<string>")
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)
+      | (?P<literal>true|false|null)
+    )?
+""", re.VERBOSE)
+
+# Longest cut-off token tail, as in "fals", that can't match yet.
+LOOKAHEAD = 5
+
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+def iter_json_tokens(stream):
+    """Yield ``(kind, value)`` tokens from ``stream``, read ``READ_SIZE``
+    characters at a time. ``kind`` is a punctuation character, ``'string'``
+    or ``'value'``. Only a token cut by a read is decoded again."""
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        data = stream.read(READ_SIZE)
+        eof = not data
+        buffer = buffer[pos:] + data
+        pos = 0
+
+    while True:
+        match = TOKEN.match(buffer, pos)
+        if len(buffer) - match.end() < LOOKAHEAD and not eof:
+            # A number or literal cut by the read may match only in part, or
+            # not at all.
+            read_more()
+            continue
+        kind = match.lastgroup
+        if kind is None:
+            if match.end() == len(buffer):
+                return
+            raise ValueError('invalid JSON at {!r}'.format(
+                buffer[match.end():match.end() + 20]))
+        if kind == 'string':
+            try:
+                value, pos = scanstring(buffer, match.end())
+            except ValueError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            yield 'string', value
+            continue
+        pos = match.end()
+        token = match.group(kind)
+        if kind == 'punctuation':
+            yield token, None
+        elif kind == 'number':
+            is_float = any(c in token for c in '.eE')
+            yield 'value', float(token) if is_float else int(token)
+        else:
+            yield 'value', LITERALS[token]
+
+
+def iter_json_events(tokens):
+    """Check the token grammar and yield ``start_map``, ``key``,
+    ``end_map``, ``start_array``, ``end_array`` and ``value`` events."""
+    closing = {'{': '}', '[': ']'}
+    stack = []
+    # One of: value, first_value (or "]"), key, first_key (or "}"), colon,
+    # comma (or closing bracket), done.
+    expect = 'value'
+    for kind, value in tokens:
+        if expect == 'colon' and kind == ':':
+            expect = 'value'
+            continue
+        if expect == 'comma' and kind == ',':
+            expect = 'key' if stack[-1] == '{' else 'value'
+            continue
+        if expect in ('key', 'first_key') and kind == 'string':
+            yield 'key', value
+            expect = 'colon'
+            continue
+        if (expect in ('comma', 'first_key', 'first_value') and stack and
+                kind == closing[stack[-1]]):
+            yield 'end_map' if stack.pop() == '{' else 'end_array', None
+        elif expect in ('value', 'first_value') and kind in ('string',
+                                                             'value'):
+            yield 'value', value
+        elif expect in ('value', 'first_value') and kind in closing:
+            stack.append(kind)
+            yield 'start_map' if kind == '{' else 'start_array', None
+            expect = 'first_key' if kind == '{' else 'first_value'
+            continue
+        else:
+            raise ValueError('unexpected {!r} in JSON'.format(
+                value if kind in ('string', 'value') else kind))
+        expect = 'comma' if stack else 'done'
+    if expect != 'done':
+        raise ValueError('unexpected end of JSON input')
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from categories.loadtest import run_load, summarize
+
+
+class Command(BaseCommand):
+    help = ('Send concurrent tree creates and detail retrieves to the WSGI '
+            'app in-process (against the configured database) or to a '
+            'running server, and report throughput, latency percentiles and '
+            'SQLite lock errors.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server, '
+                                          'e.g. http://127.0.0.1:8000. The '
+                                          'app is called in-process when '
+                                          'omitted.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent workers.')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run workers as processes, not threads.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests across all workers.')
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Share of requests that create a tree.')
+        parser.add_argument('--tree-size', type=int, default=10,
+                            help='Categories per created tree.')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['requests'] < 1:
+            raise CommandError('--workers and --requests must be positive.')
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1.')
+        if options['tree_size'] < 1:
+            raise CommandError('--tree-size must be positive.')
+        try:
+            samples, seconds = run_load(
+                base_url=options['url'], workers=options['workers'],
+                processes=options['processes'], requests=options['requests'],
+                write_ratio=options['write_ratio'],
+                tree_size=options['tree_size'])
+        except (OSError, RuntimeError) as e:
+            raise CommandError(str(e))
+        report = summarize(samples, seconds)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write('{} requests in {:.2f}s'.format(len(samples),
+                                                          seconds))
+        self.stdout.write('{:<10}{:>9}{:>10}{:>10}{:>10}{:>10}{:>8}  {}'.format(
+            'operation', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'locked', 'statuses'))
+        for name in ('all', 'create', 'retrieve'):
+            row = report[name]
+            if not row['requests']:
+                continue
+            self.stdout.write(
+                '{:<10}{:>9}{:>10}{:>10}{:>10}{:>10}{:>8}  {}'.format(
+                    name, row['requests'], row['throughput'], row['p50'],
+                    row['p95'], row['p99'], row['lock_errors'],
+                    ', '.join('{}: {}'.format(status, count) for status, count
+                              in sorted(row['statuses'].items()))))
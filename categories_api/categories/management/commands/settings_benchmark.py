@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+PROFILES = ('categories_api.settings', 'categories_api.settings_api')
+
+# Run in a fresh interpreter per measurement.
+PROFILE_MODULE = 'categories.management.settings_profile'
+
+FIELDS = ('startup_ms', 'modules', 'first_request_ms', 'request_us_p50',
+          'request_us_mean')
+
+
+class Command(BaseCommand):
+    help = ('Compare worker startup time and per-request overhead of '
+            'settings profiles, each measured in fresh interpreters.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', default=PROFILES,
+                            help='Settings modules to compare.')
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh interpreters per profile; medians '
+                                 'are reported.')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests timed per run.')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1 or options['requests'] < 1:
+            raise CommandError('--runs and --requests must be positive.')
+        report = {profile: self.measure(profile, options['runs'],
+                                        options['requests'])
+                  for profile in options['profiles']}
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write('{:<32}{:>12}{:>9}{:>14}{:>12}{:>12}'.format(
+            'profile', 'startup ms', 'modules', 'first req ms', 'req p50 us',
+            'req mean us'))
+        for profile, row in report.items():
+            self.stdout.write('{:<32}{:>12}{:>9}{:>14}{:>12}{:>12}'.format(
+                profile, *(row[field] for field in FIELDS)))
+
+    @staticmethod
+    def measure(profile, runs, requests):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+        results = []
+        for _ in range(runs):
+            process = subprocess.run(
+                [sys.executable, '-m', PROFILE_MODULE,
+                 '--requests', str(requests)],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True)
+            if process.returncode:
+                raise CommandError('{} failed:\n{}'.format(
+                    profile, process.stderr or process.stdout))
+            results.append(json.loads(process.stdout))
+        return {field: median(result[field] for result in results)
+                for field in FIELDS}
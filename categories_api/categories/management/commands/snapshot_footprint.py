@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from categories.snapshot import DEFAULTS, GraphSnapshot
+
+
+class Command(BaseCommand):
+    help = ('Load the in-memory category graph snapshot and report how much '
+            'memory it takes, to size workers before enabling '
+            'CATEGORIES_SNAPSHOT.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        snapshot = GraphSnapshot(
+            dict(DEFAULTS, **getattr(settings, 'CATEGORIES_SNAPSHOT', {})))
+        snapshot.load()
+        seconds = time.monotonic() - started
+        report = snapshot.footprint()
+
+        self.stdout.write('{} categories, {} links loaded in {:.2f}s'.format(
+            report.pop('categories'), report.pop('links'), seconds))
+        total = report.pop('total')
+        for name, size in report.items():
+            self.stdout.write('{:<16}{:>14,} bytes'.format(name, size))
+        self.stdout.write('{:<16}{:>14,} bytes'.format('total', total))
@@ -0,0 +1,71 @@
+"""Startup time and per-request overhead of the settings module in
+DJANGO_SETTINGS_MODULE, measured in a fresh interpreter:
+
+    python -m categories.management.settings_profile --requests 2000
+
+Prints one JSON object; ``settings_benchmark`` runs it for each profile.
+"""
+import argparse
+import json
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+
+def measure(requests, path):
+    started = time.perf_counter()
+    from categories_api.wsgi import application
+    from django.urls import resolve
+    # Imports the URLconf and views, which the first request would do.
+    resolve(path)
+    startup = time.perf_counter() - started
+    modules = len(sys.modules)
+
+    started = time.perf_counter()
+    status = get(application, path)
+    first_request = time.perf_counter() - started
+    if status != 200:
+        raise SystemExit('GET {} returned {}'.format(path, status))
+
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        get(application, path)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        'startup_ms': round(startup * 1000, 2),
+        'modules': modules,
+        'first_request_ms': round(first_request * 1000, 2),
+        'request_us_p50': round(samples[len(samples) // 2] * 1e6, 1),
+        'request_us_mean': round(sum(samples) / len(samples) * 1e6, 1),
+    }
+
+
+def get(application, path):
+    """Call the WSGI app directly and return the response status."""
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    setup_testing_defaults(environ)
+    started = []
+    response = application(
+        environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return int(started[0].split()[0])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    # No queries, so only the framework and middleware are measured.
+    parser.add_argument('--path', default='/api/stats/cache/')
+    args = parser.parse_args()
+    print(json.dumps(measure(args.requests, args.path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.16 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=1024, unique=True, verbose_name='Category name')),
+                ('kids', models.ManyToManyField(related_name='child_of', to='categories.Category')),
+                ('siblings', models.ManyToManyField(related_name='_category_siblings_+', to='categories.Category')),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+import logging
+
+from django.db import migrations
+from django.db.models import Case, Exists, F, OuterRef, When
+
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_siblings(apps, schema_editor):
+    """Drop sibling rows; siblings are derived from shared parents now.
+
+    Every pair written through the API shares a parent already. Pairs added
+    by hand without a shared parent can't be kept without changing
+    ``kids``, so they are dropped with the table and counted.
+    """
+    db_alias = schema_editor.connection.alias
+    Category = apps.get_model('categories', 'Category')
+    Kids = Category.kids.through
+    Siblings = Category.siblings.through
+
+    shared_parent = Kids.objects.using(db_alias).filter(
+        to_category_id=OuterRef('from_category_id'),
+        from_category__kids=OuterRef('to_category_id'))
+    # Pairs may be stored in both directions; count each once.
+    lower = When(from_category_id__lt=F('to_category_id'),
+                 then=F('from_category_id'))
+    higher = When(from_category_id__lt=F('to_category_id'),
+                  then=F('to_category_id'))
+    dropped = (Siblings.objects.using(db_alias)
+               .annotate(shared=Exists(shared_parent)).filter(shared=False)
+               .annotate(low=Case(lower, default=F('to_category_id')),
+                         high=Case(higher, default=F('from_category_id')))
+               .values('low', 'high').distinct().count())
+    if dropped:
+        logger.warning('Dropped %d sibling pairs without a shared parent.',
+                       dropped)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_siblings, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='category',
+            name='siblings',
+        ),
+    ]
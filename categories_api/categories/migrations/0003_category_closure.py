@@ -0,0 +1,76 @@
+# Generated by Django 2.1.16 on 2026-10-18 14:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_closure(apps, schema_editor):
+    """Build closure rows from the kids graph, parents before kids.
+
+    Where a category is reachable through several paths the shortest depth
+    is kept.
+    """
+    db_alias = schema_editor.connection.alias
+    Category = apps.get_model('categories', 'Category')
+    CategoryClosure = apps.get_model('categories', 'CategoryClosure')
+    Kids = Category.kids.through
+
+    kids = {}
+    pending = {pk: 0 for pk in
+               Category.objects.using(db_alias).values_list('pk', flat=True).iterator()}
+    for parent_id, kid_id in Kids.objects.using(db_alias).values_list(
+            'from_category_id', 'to_category_id').iterator():
+        kids.setdefault(parent_id, []).append(kid_id)
+        pending[kid_id] += 1
+
+    ancestors = {}
+    ready = [pk for pk, count in pending.items() if count == 0]
+    for pk in ready:
+        ancestors[pk] = {pk: 0}
+    rows = []
+    while ready:
+        pk = ready.pop()
+        for ancestor_id, depth in ancestors[pk].items():
+            rows.append(CategoryClosure(ancestor_id=ancestor_id,
+                                        descendant_id=pk, depth=depth))
+        for kid_id in kids.get(pk, ()):
+            kid_ancestors = ancestors.setdefault(kid_id, {kid_id: 0})
+            for ancestor_id, depth in ancestors[pk].items():
+                if depth + 1 < kid_ancestors.get(ancestor_id, depth + 2):
+                    kid_ancestors[ancestor_id] = depth + 1
+            pending[kid_id] -= 1
+            if pending[kid_id] == 0:
+                ready.append(kid_id)
+        del ancestors[pk]
+        if len(rows) >= 500:
+            CategoryClosure.objects.using(db_alias).bulk_create(rows)
+            rows = []
+    CategoryClosure.objects.using(db_alias).bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0002_collapse_siblings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='categories.Category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='categories.Category')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categoryclosure',
+            index=models.Index(fields=['ancestor', 'depth'], name='categories__ancesto_20b0fe_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryclosure',
+            unique_together={('ancestor', 'descendant')},
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
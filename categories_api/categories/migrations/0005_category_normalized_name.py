@@ -0,0 +1,49 @@
+# Generated by Django 2.1.16 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+NAME_MAX_LENGTH = 1024
+
+# Three parameters per row: two in the CASE and one in the IN list.
+CHUNK_SIZE = 300
+
+
+def normalize_name(name):
+    # Frozen copy of categories.models.normalize_name.
+    return ' '.join(name.casefold().split())[:NAME_MAX_LENGTH]
+
+
+def normalize_names(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Category = apps.get_model('categories', 'Category')
+    categories = Category.objects.using(db_alias)
+    last_pk = 0
+    while True:
+        rows = list(categories.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'name')[:CHUNK_SIZE])
+        if not rows:
+            break
+        categories.filter(pk__in=[pk for pk, _ in rows]).update(
+            normalized_name=models.Case(
+                *[models.When(pk=pk, then=models.Value(normalize_name(name)))
+                  for pk, name in rows],
+                output_field=models.CharField()))
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0004_category_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='normalized_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1024),
+            preserve_default=False,
+        ),
+        migrations.RunPython(normalize_names, migrations.RunPython.noop),
+    ]
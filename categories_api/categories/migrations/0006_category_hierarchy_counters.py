@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import migrations, models
+
+
+# Frozen copies of categories.models constants.
+HIERARCHY_FIELDS = ('depth', 'children_count', 'descendants_count')
+MAX_DEPTH = 10000
+
+# Three parameters per row: two in the CASE and one in the IN list.
+CHUNK_SIZE = 300
+
+
+def compute_hierarchy(pks, edges, descendant_counts):
+    """Return ``{pk: (depth, children_count, descendants_count)}``, with
+    ``depth`` following lowest-id parents."""
+    children = Counter(parent for parent, _ in edges)
+    min_parent = {}
+    for parent, kid in edges:
+        if parent < min_parent.get(kid, parent + 1):
+            min_parent[kid] = parent
+    depths = {}
+    for pk in pks:
+        path = []
+        node = pk
+        while node not in depths:
+            parent = min_parent.get(node)
+            if parent is None or len(path) >= MAX_DEPTH:
+                depths[node] = 0
+                break
+            path.append(node)
+            node = parent
+        depth = depths[node]
+        for node in reversed(path):
+            depth += 1
+            depths[node] = depth
+    return {pk: (depths[pk], children[pk], descendant_counts.get(pk, 0))
+            for pk in pks}
+
+
+def update_values(queryset, field, values):
+    items = sorted(values.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = items[start:start + CHUNK_SIZE]
+        queryset.filter(pk__in=[pk for pk, _ in chunk]).update(**{
+            field: models.Case(
+                *[models.When(pk=pk, then=models.Value(value))
+                  for pk, value in chunk],
+                output_field=models.PositiveIntegerField())})
+
+
+def backfill_hierarchy(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Category = apps.get_model('categories', 'Category')
+    CategoryClosure = apps.get_model('categories', 'CategoryClosure')
+    Kids = Category.kids.through
+
+    pks = list(Category.objects.using(db_alias).values_list('pk', flat=True))
+    edges = list(Kids.objects.using(db_alias).values_list(
+        'from_category_id', 'to_category_id'))
+    descendants = dict(
+        CategoryClosure.objects.using(db_alias).filter(depth__gt=0)
+        .order_by().values('ancestor_id').annotate(count=models.Count('pk'))
+        .values_list('ancestor_id', 'count'))
+    hierarchy = compute_hierarchy(pks, edges, descendants)
+    categories = Category.objects.using(db_alias).all()
+    for index, field in enumerate(HIERARCHY_FIELDS):
+        update_values(categories, field,
+                      {pk: values[index] for pk, values in hierarchy.items()
+                       if values[index]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0005_category_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='children_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='descendants_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.1.15 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0006_category_hierarchy_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Category created'), ('linked', 'Kid linked')], max_length=16)),
+                ('category', models.PositiveIntegerField()),
+                ('parent', models.PositiveIntegerField(null=True)),
+                ('name', models.CharField(blank=True, max_length=1024)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
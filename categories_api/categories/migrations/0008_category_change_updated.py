@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0007_category_change'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categorychange',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Category created'), ('linked', 'Kid linked'), ('updated', 'Category updated')], max_length=16),
+        ),
+    ]
@@ -1,11 +1,112 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+NAME_MAX_LENGTH = 1024
+
+HIERARCHY_FIELDS = ('depth', 'children_count', 'descendants_count')
+
+# Longest parent chain followed before the kids graph is assumed to loop.
+MAX_DEPTH = 10000
+
+CHANGES_DEFAULTS = {
+    # Changes logged this recently are read again on the next poll. Must
+    # be longer than the longest write transaction.
+    'SETTLE_SECONDS': 5,
+}
+
+
+def normalize_name(name):
+    """Search key for ``name``: case-folded with whitespace collapsed."""
+    return ' '.join(name.casefold().split())[:NAME_MAX_LENGTH]
 
 
 class Category(models.Model):
     name = models.CharField(verbose_name='Category name', max_length=1024,
                             unique=True)
+    # Prefix index for search; bulk inserts must fill it in themselves.
+    normalized_name = models.CharField(max_length=NAME_MAX_LENGTH,
+                                       db_index=True, editable=False)
     kids = models.ManyToManyField('self', symmetrical=False,
                                   related_name='child_of')
-    siblings = models.ManyToManyField('self', symmetrical=True,
-                                    related_name='sibling_of')
+    # Bumped whenever children, siblings or the ancestor chain change; used
+    # as the ETag of the category detail response.
+    version = models.PositiveIntegerField(default=1)
+    # Maintained by categories.tree on insert and recomputed by the
+    # repair_hierarchy command. ``depth`` follows the lowest-id parent,
+    # like the ``parents`` list of the detail response.
+    depth = models.PositiveIntegerField(default=0)
+    children_count = models.PositiveIntegerField(default=0)
+    descendants_count = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    @property
+    def siblings(self):
+        # Siblings are the other kids of this category's parents, so they
+        # are derived from ``kids`` instead of being stored pairwise.
+        return (Category.objects.filter(child_of__kids=self)
+                .exclude(pk=self.pk).distinct().order_by('pk'))
+
+
+class CategoryClosure(models.Model):
+    """One row per (ancestor, descendant) pair, including a category and
+    itself at depth 0. Maintained by ``categories.tree`` on insert."""
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                   related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [models.Index(fields=['ancestor', 'depth'])]
+
+
+class CategoryChange(models.Model):
+    """Append-only log of writes for incremental consumers; the primary key
+    is the cursor of ``categories/changes/``. Ids aren't foreign keys so
+    the log never has to be rewritten."""
+    CREATED = 'created'
+    LINKED = 'linked'
+    # Rows rewritten outside the request path, e.g. by repair_hierarchy.
+    UPDATED = 'updated'
+    KINDS = ((CREATED, 'Category created'), (LINKED, 'Kid linked'),
+             (UPDATED, 'Category updated'))
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    category = models.PositiveIntegerField()
+    # The new parent of ``category`` for LINKED changes.
+    parent = models.PositiveIntegerField(null=True)
+    name = models.CharField(max_length=NAME_MAX_LENGTH, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+def settled_cursor(since, changes):
+    """Return the change id reached by skipping the leading ``changes``,
+    ``(id, created_at)`` pairs in id order after ``since``, that were
+    logged at least SETTLE_SECONDS ago.
+
+    Ids are handed out before commit, so with concurrent writers (unlike
+    SQLite) a lower id can become visible after higher ones. Keeping
+    cursors behind recent changes lets readers pick those up.
+    """
+    settled = settle_time()
+    for change_id, created_at in changes:
+        if created_at > settled:
+            break
+        since = change_id
+    return since
+
 
+def settle_time():
+    """Changes logged after this time may still be followed by late
+    commits with lower ids."""
+    options = dict(CHANGES_DEFAULTS,
+                   **getattr(settings, 'CATEGORIES_CHANGES', {}))
+    return timezone.now() - timedelta(seconds=options['SETTLE_SECONDS'])
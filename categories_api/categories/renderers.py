@@ -0,0 +1,50 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it is installed.
+
+    Output is byte-identical to JSONRenderer: both write compact UTF-8 and
+    U+2028/U+2029 are escaped the same way afterwards. Indented responses,
+    other UNICODE_JSON/COMPACT_JSON settings and data orjson can't encode
+    (Decimal, lazy strings, huge ints) go through JSONRenderer. Use it on
+    views whose payloads hold no floats; orjson formats exponents
+    differently.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or
+                not self.compact or
+                self.get_indent(accepted_media_type,
+                                renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return (ret.replace('\u2028'.encode('utf-8'), b'\\u2028')
+                .replace('\u2029'.encode('utf-8'), b'\\u2029'))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON.
+
+    Successful responses are streamed by the view itself; this renders the
+    non-streamed ones, such as errors, as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        line = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return (line + '\n').encode('utf-8')
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+DEFAULTS = {
+    # Aliases from settings.DATABASES that serve category reads. Empty
+    # sends everything to the primary.
+    'ALIASES': [],
+    # How long a client keeps reading from the primary after a write, to
+    # cover replication lag.
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'categories_primary',
+}
+
+_state = threading.local()
+
+
+def get_options():
+    return dict(DEFAULTS, **getattr(settings, 'CATEGORIES_REPLICAS', {}))
+
+
+def pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def pin_to_primary(value=True):
+    _state.pinned = value
+
+
+class ReplicaRouter:
+    """Send reads of the categories app to a replica and writes to the
+    primary.
+
+    Reads stay on the primary while the current request is pinned (see
+    ``ReplicaPinningMiddleware``) and inside transactions on the primary,
+    so get-or-create writers see their own rows.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'categories':
+            return None
+        aliases = get_options()['ALIASES']
+        if (not aliases or pinned() or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'categories':
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """Pin requests to the primary while a client's own writes may not
+    have reached the replicas yet.
+
+    Unsafe requests always run on the primary and, when they succeed, set
+    a cookie holding the time until which that client's reads follow.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_options()
+        cookie = options['COOKIE_NAME']
+        write = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        pin_to_primary(write or sticky(request.COOKIES.get(cookie)))
+        try:
+            response = self.get_response(request)
+        finally:
+            pin_to_primary(False)
+        if write and response.status_code < 400 and options['ALIASES']:
+            seconds = options['STICKY_SECONDS']
+            response.set_cookie(cookie, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True)
+        return response
+
+
+def sticky(value):
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
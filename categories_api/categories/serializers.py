@@ -4,10 +4,13 @@ from rest_framework.serializers import (
     JSONField,
     ValidationError,
     IntegerField,
+    BooleanField,
     CharField
 )
 
-from categories.models import Category
+from categories.coalesce import get_write_coalescer
+from categories.models import Category, CategoryChange
+from categories.tree import create_tree
 
 
 class CategoryCreateSerializer(ModelSerializer):
@@ -16,15 +19,17 @@ class CategoryCreateSerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ('name', 'children')
+        # Uniqueness is checked for the whole tree at once by create_tree.
+        extra_kwargs = {'name': {'validators': []}}
 
     def create(self, validated_data):
         name = self.get_name(validated_data)
-        parent = Category.objects.create(name=name)
         children = self.get_children(validated_data)
-
-        if len(children) > 0:
-            self.process_kids(parent, children)
-        return parent
+        root = {'name': name, 'children': children}
+        coalescer = get_write_coalescer()
+        if coalescer is not None:
+            return coalescer.create_tree(root)
+        return create_tree(root)
 
     @staticmethod
     def get_name(validated_data):
@@ -40,35 +45,72 @@ class CategoryCreateSerializer(ModelSerializer):
         except KeyError:
             return []
 
-    @staticmethod
-    def process_kids(parent, children):
-        kids = []
-        for child in children:
-            kids.append(CategoryCreateSerializer.retreive_kid(child))
-        parent.kids.add(*kids)
-        CategoryCreateSerializer.set_siblings(kids)
-
-    @staticmethod
-    def retreive_kid(child):
-        serializer = CategoryCreateSerializer(data=child)
-        serializer.is_valid(raise_exception=True)
-        return serializer.create(serializer.validated_data)
-
-    @staticmethod
-    def set_siblings(kids):
-        if len(kids) > 0:
-            for i, kid in enumerate(kids):
-                kid.siblings.add(*kids[i+1:])
-
 
 class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
+class CategoryMergedSerializer(Serializer):
+    id = IntegerField()
+    name = CharField(max_length=1024)
+    created = BooleanField()
+
+
+class CategoryBatchCreateSerializer(Serializer):
+    created = IntegerField()
+    roots = CategoryMergedSerializer(many=True)
+
+
 class CategoryRetrieveSerializer(Serializer):
     id = IntegerField()
     name = CharField(max_length=1024)
     children = CategorySerializer(many=True, required=False)
     parents = CategorySerializer(many=True, required=False)
     siblings = CategorySerializer(many=True, required=False)
+    depth = IntegerField()
+    children_count = IntegerField()
+    descendants_count = IntegerField()
+    children_next = CharField(required=False)
+    siblings_next = CharField(required=False)
+
+
+class CategoryNodeSerializer(Serializer):
+    id = IntegerField()
+    name = CharField(max_length=1024)
+
+    def get_fields(self):
+        # Nested lazily; nodes on the last expanded level have no children.
+        fields = super().get_fields()
+        fields['children'] = CategoryNodeSerializer(many=True, required=False)
+        return fields
+
+
+class CategoryTreeRetrieveSerializer(CategoryRetrieveSerializer):
+    children = CategoryNodeSerializer(many=True, required=False)
+    truncated = BooleanField(required=False)
+
+
+class CategoryDescendantSerializer(Serializer):
+    id = IntegerField()
+    name = CharField(max_length=1024)
+    parent = IntegerField()
+    depth = IntegerField()
+
+
+class CategorySubtreeSerializer(Serializer):
+    id = IntegerField()
+    name = CharField(max_length=1024)
+    descendants = CategoryDescendantSerializer(many=True, required=False)
+
+
+class CategoryChangeSerializer(ModelSerializer):
+    class Meta:
+        model = CategoryChange
+        fields = ('id', 'kind', 'category', 'parent', 'name', 'created_at')
+
+
+class CategoryChangesSerializer(Serializer):
+    results = CategoryChangeSerializer(many=True)
+    cursor = CharField()
+    next = CharField(allow_null=True)
@@ -0,0 +1,435 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections
+
+from categories.models import (
+    HIERARCHY_FIELDS,
+    MAX_DEPTH,
+    Category,
+    CategoryChange,
+    settle_time,
+    settled_cursor,
+)
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Seconds between checks for rows written by other processes. Writes
+    # made in this process mark the snapshot stale straight away.
+    'REFRESH_INTERVAL': 5,
+    # Fold incrementally added links into the CSR arrays once they exceed
+    # this share of all links.
+    'REBUILD_RATIO': 0.1,
+}
+
+
+def csr(size, edges):
+    """Build compressed sparse row arrays for ``(source, target)`` index
+    pairs: targets of ``i`` are ``targets[offsets[i]:offsets[i + 1]]``,
+    sorted so they come out in id order."""
+    offsets = array('q', [0]) * (size + 1)
+    for source, _ in edges:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+    targets = array('q', [0]) * offsets[size]
+    fill = array('q', offsets)
+    for source, target in edges:
+        targets[fill[source]] = target
+        fill[source] += 1
+    for i in range(size):
+        start, end = offsets[i], offsets[i + 1]
+        if end - start > 1:
+            targets[start:end] = array('q', sorted(targets[start:end]))
+    return offsets, targets
+
+
+class GraphSnapshot:
+    """Read-only copy of the category graph in compact arrays.
+
+    Categories are stored by position in ``ids`` (sorted, so positions
+    follow id order), names in an interned table and kids/parents as CSR
+    adjacency arrays. Links added after loading live in small overlay
+    dicts until the next rebuild.
+
+    Refreshes follow the change log rather than the tables, from a cursor
+    kept behind unsettled changes (see ``models.settled_cursor``). Changes
+    may be applied more than once, so applying one is idempotent.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.Lock()
+        self.pending = set()
+        self.stale = False
+        self.checked_at = 0
+        self.last_change_id = 0
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.names = []
+        self.versions = array('q')
+        self.counters = {field: array('q') for field in HIERARCHY_FIELDS}
+        self.links = []
+        self.rebuild()
+
+    # Loading and refreshing.
+
+    def load(self):
+        with self.lock:
+            self.last_change_id = (
+                CategoryChange.objects.filter(created_at__lte=settle_time())
+                .order_by('-pk').values_list('pk', flat=True).first() or 0)
+            # Links first: every category they point at was committed no
+            # later than the link, so the category query below sees it.
+            links = list(Category.kids.through.objects
+                         .values_list('from_category_id', 'to_category_id')
+                         .iterator())
+            self.clear()
+            for row in (Category.objects.order_by('pk')
+                        .values_list('pk', 'name', 'version',
+                                     *HIERARCHY_FIELDS)
+                        .iterator()):
+                self.append_category(*row)
+            # Skip links to categories deleted between the two queries.
+            self.links = [link for link in (
+                (self.index(parent), self.index(kid))
+                for parent, kid in links) if None not in link]
+            self.rebuild()
+            self.checked_at = time.monotonic()
+
+    def fetch_changes(self):
+        """``(id, kind, category, parent, created_at)`` rows logged after
+        the cursor, oldest first."""
+        return list(CategoryChange.objects
+                    .filter(pk__gt=self.last_change_id)
+                    .order_by('pk')
+                    .values_list('pk', 'kind', 'category', 'parent',
+                                 'created_at')
+                    .iterator())
+
+    def fetch_categories(self, pks):
+        pks = sorted(pks)
+        rows = []
+        for start in range(0, len(pks), 500):
+            rows.extend(Category.objects.filter(pk__in=pks[start:start + 500])
+                        .values_list('pk', 'name', 'version',
+                                     *HIERARCHY_FIELDS))
+        return rows
+
+    def add_categories(self, rows):
+        rows = sorted(rows)
+        if not rows:
+            return
+        if not self.ids or rows[0][0] > self.ids[-1]:
+            for row in rows:
+                self.append_category(*row)
+            return
+        # A category committed after higher ids were loaded, so positions
+        # shift: rebuild every array around it.
+        links = [(self.ids[parent], self.ids[kid])
+                 for parent, kid in self.all_links()]
+        rows = sorted(rows + [self.row(i) for i in range(len(self.ids))])
+        self.clear()
+        for row in rows:
+            self.append_category(*row)
+        self.links = [(self.index(parent), self.index(kid))
+                      for parent, kid in links]
+        self.rebuild()
+
+    def row(self, i):
+        return ((self.ids[i], self.names[i], self.versions[i]) +
+                tuple(self.counters[field][i] for field in HIERARCHY_FIELDS))
+
+    def append_category(self, pk, name, version, *counters):
+        self.ids.append(pk)
+        self.names.append(sys.intern(name))
+        self.versions.append(version)
+        for field, value in zip(HIERARCHY_FIELDS, counters):
+            self.counters[field].append(value)
+        # No CSR entries yet; its links go to the overlay until a rebuild.
+        self.kid_offsets.append(self.kid_offsets[-1])
+        self.parent_offsets.append(self.parent_offsets[-1])
+
+    def rebuild(self, arrays=None):
+        """Fold the overlay into CSR arrays, or install ``arrays`` that
+        ``csr_arrays`` built from every link."""
+        (self.kid_offsets, self.kid_targets,
+         self.parent_offsets, self.parent_targets) = (
+             arrays or self.csr_arrays(self.links))
+        self.links = []
+        self.extra_kids = {}
+        self.extra_parents = {}
+
+    def csr_arrays(self, links):
+        size = len(self.ids)
+        return csr(size, links) + csr(
+            size, [(kid, parent) for parent, kid in links])
+
+    def refresh_if_needed(self):
+        interval = self.options['REFRESH_INTERVAL']
+        if not self.stale and time.monotonic() - self.checked_at < interval:
+            return
+        # Readers arriving while another thread refreshes serve the
+        # current arrays instead of waiting.
+        if self.refresh_lock.acquire(blocking=False):
+            try:
+                self.apply_changes()
+            finally:
+                self.refresh_lock.release()
+
+    def refresh(self):
+        """Apply changes logged since the last refresh."""
+        with self.refresh_lock:
+            self.apply_changes()
+
+    def apply_changes(self):
+        # Only the thread holding refresh_lock changes the arrays, so it
+        # reads them and the database without holding self.lock.
+        self.stale = False
+        self.checked_at = time.monotonic()
+        changes = self.fetch_changes()
+        links = [(parent, pk) for _, kind, pk, parent, _ in changes
+                 if kind == CategoryChange.LINKED]
+        updated = set(pk for _, kind, pk, _, _ in changes
+                      if kind == CategoryChange.UPDATED)
+        # New categories, and linked ones created without a change log
+        # entry, e.g. from the admin.
+        wanted = set(pk for _, kind, pk, _, _ in changes
+                     if kind == CategoryChange.CREATED)
+        wanted.update(pk for link in links for pk in link)
+        rows = self.fetch_categories(
+            pk for pk in wanted if self.index(pk) is None)
+
+        with self.lock:
+            self.add_categories(rows)
+            touched = set(i for i in map(self.index, updated)
+                          if i is not None)
+            added = 0
+            for parent, kid in links:
+                parent, kid = self.index(parent), self.index(kid)
+                # Deleted since, or already loaded or applied.
+                if parent is None or kid is None or kid in self.kids(parent):
+                    continue
+                self.extra_kids.setdefault(parent, []).append(kid)
+                self.extra_parents.setdefault(kid, []).append(parent)
+                self.links.append((parent, kid))
+                added += 1
+                # Same rule as tree.merge_nodes; their versions were bumped
+                # by the write.
+                touched.update(self.walk_up(parent))
+                touched.update(self.kids(parent))
+                touched.update(self.walk(kid))
+            # Served from the database until their versions are read.
+            self.pending = touched
+
+        rows = self.fetch_rows(touched)
+        with self.lock:
+            for pk, version, *counters in rows:
+                i = self.index(pk)
+                self.versions[i] = version
+                for field, value in zip(HIERARCHY_FIELDS, counters):
+                    self.counters[field][i] = value
+            self.pending = set()
+        self.last_change_id = settled_cursor(
+            self.last_change_id,
+            [(change[0], change[-1]) for change in changes])
+
+        if added and len(self.links) > (
+                self.options['REBUILD_RATIO'] * len(self.kid_targets)):
+            arrays = self.csr_arrays(self.all_links())
+            with self.lock:
+                self.rebuild(arrays)
+
+    def fetch_rows(self, indexes):
+        pks = [self.ids[i] for i in indexes]
+        rows = []
+        for start in range(0, len(pks), 500):
+            rows.extend(Category.objects.filter(pk__in=pks[start:start + 500])
+                        .values_list('pk', 'version', *HIERARCHY_FIELDS))
+        return rows
+
+    def all_links(self):
+        return [(parent, kid) for parent in range(len(self.ids))
+                for kid in self.kids(parent)]
+
+    # Lookups; categories are addressed by position.
+
+    def index(self, pk):
+        i = bisect_left(self.ids, pk)
+        if i < len(self.ids) and self.ids[i] == pk:
+            return i
+        return None
+
+    def kids(self, i):
+        kids = self.kid_targets[self.kid_offsets[i]:self.kid_offsets[i + 1]]
+        if i in self.extra_kids:
+            return sorted(set(kids).union(self.extra_kids[i]))
+        return list(kids)
+
+    def parents(self, i):
+        parents = self.parent_targets[
+            self.parent_offsets[i]:self.parent_offsets[i + 1]]
+        if i in self.extra_parents:
+            return sorted(set(parents).union(self.extra_parents[i]))
+        return list(parents)
+
+    def node(self, i):
+        return {'id': self.ids[i], 'name': self.names[i]}
+
+    def ancestors(self, i):
+        """Nearest-first chain following the lowest-id parent, like
+        ``views.fetch_ancestors``."""
+        chain = []
+        parents = self.parents(i)
+        while parents and len(chain) < MAX_DEPTH:
+            i = parents[0]
+            chain.append(i)
+            parents = self.parents(i)
+        return chain
+
+    def siblings(self, i):
+        return sorted(set(kid for parent in self.parents(i)
+                          for kid in self.kids(parent)) - {i})
+
+    def walk(self, i):
+        """Breadth-first indexes of the subtree under ``i``, itself
+        included."""
+        seen = {i}
+        frontier = [i]
+        while frontier:
+            for node in frontier:
+                yield node
+            frontier = [kid for node in frontier for kid in self.kids(node)
+                        if kid not in seen and not seen.add(kid)]
+
+    def walk_up(self, i):
+        """Indexes of ``i`` and all of its ancestors."""
+        seen = {i}
+        frontier = [i]
+        while frontier:
+            frontier = [parent for node in frontier
+                        for parent in self.parents(node)
+                        if parent not in seen and not seen.add(parent)]
+        return seen
+
+    def detail(self, pk):
+        """Return ``(version, payload)`` for the retrieve endpoint, or None
+        when ``pk`` isn't in the snapshot yet or is being refreshed."""
+        self.refresh_if_needed()
+        with self.lock:
+            i = self.index(pk)
+            if i is None or i in self.pending:
+                return None
+            data = self.node(i)
+            data['children'] = [self.node(kid) for kid in self.kids(i)]
+            data['parents'] = [self.node(p) for p in self.ancestors(i)]
+            data['siblings'] = [self.node(s) for s in self.siblings(i)]
+            for field in HIERARCHY_FIELDS:
+                data[field] = self.counters[field][i]
+            return self.versions[i], data
+
+    def subtree(self, pk):
+        """``(id, name, parent, depth)`` rows like ``views.fetch_subtree``,
+        or None when ``pk`` isn't in the snapshot yet or is being
+        refreshed."""
+        self.refresh_if_needed()
+        with self.lock:
+            i = self.index(pk)
+            if i is None or i in self.pending:
+                return None
+            rows = []
+            seen = {i}
+            frontier = [i]
+            depth = 0
+            while frontier:
+                for node in sorted(frontier):
+                    parents = self.parents(node)
+                    rows.append((self.ids[node], self.names[node],
+                                 self.ids[parents[0]] if parents else None,
+                                 depth))
+                depth += 1
+                frontier = [kid for node in frontier
+                            for kid in self.kids(node)
+                            if kid not in seen and not seen.add(kid)]
+            return rows
+
+    def footprint(self):
+        """Approximate memory use in bytes, for sizing workers."""
+        with self.lock:
+            arrays = {
+                'ids': self.ids,
+                'versions': self.versions,
+                'kid_offsets': self.kid_offsets,
+                'kid_targets': self.kid_targets,
+                'parent_offsets': self.parent_offsets,
+                'parent_targets': self.parent_targets,
+            }
+            arrays.update(self.counters)
+            report = {name: a.buffer_info()[1] * a.itemsize
+                      for name, a in arrays.items()}
+            report['names'] = (sys.getsizeof(self.names) +
+                               sum(sys.getsizeof(n) for n in self.names))
+            report['overlay'] = (
+                sys.getsizeof(self.links) + sys.getsizeof(self.extra_kids) +
+                sys.getsizeof(self.extra_parents) +
+                sum(sys.getsizeof(v) for v in self.extra_kids.values()) +
+                sum(sys.getsizeof(v) for v in self.extra_parents.values()))
+            report['total'] = sum(report.values())
+            report['categories'] = len(self.ids)
+            report['links'] = len(self.kid_targets) + len(self.links)
+            return report
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Return the loaded snapshot, or None when it is disabled."""
+    global _snapshot
+    options = dict(DEFAULTS, **getattr(settings, 'CATEGORIES_SNAPSHOT', {}))
+    if not options['ENABLED']:
+        return None
+    with _snapshot_lock:
+        if _snapshot is None:
+            snapshot = GraphSnapshot(options)
+            snapshot.load()
+            _snapshot = snapshot
+    return _snapshot
+
+
+def load_snapshot():
+    """Load the snapshot, when enabled, as the app starts so that no
+    request pays for it."""
+    try:
+        get_snapshot()
+    except DatabaseError:
+        # Not migrated yet, e.g. while running migrate; the first request
+        # loads it instead.
+        pass
+    finally:
+        # Pre-forking servers must not share the loading connection.
+        connections.close_all()
+
+
+def mark_snapshot_stale():
+    if _snapshot is not None:
+        _snapshot.stale = True
+
+
+def reset_snapshot(*args, **kwargs):
+    global _snapshot
+    if kwargs.get('setting') in (None, 'CATEGORIES_SNAPSHOT'):
+        _snapshot = None
+
+
+setting_changed.connect(reset_snapshot)
@@ -0,0 +1,133 @@
+from django.db import connection
+from django.urls import resolve
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category, CategoryClosure
+from categories.test.utils import walk_kids
+
+
+TREE = {
+    'name': 'Category 1',
+    'children': [
+        {'name': 'Category 1.1', 'children': [
+            {'name': 'Category 1.1.1', 'children': [
+                {'name': 'Category 1.1.1.1'},
+                {'name': 'Category 1.1.1.2'},
+            ]},
+            {'name': 'Category 1.1.2'},
+        ]},
+        {'name': 'Category 1.2', 'children': [
+            {'name': 'Category 1.2.1'},
+        ]},
+    ]
+}
+
+
+class BatchRetrieveTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('categories-app:category-batch')
+        response = self.client.post(reverse('categories-app:category-create'),
+                                    TREE, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def get_batch(self, ids):
+        return self.client.get(self.url, {'ids': ','.join(map(str, ids))})
+
+    def test_same_payload_as_detail(self):
+        ids = [4, 1, 999, 2, 8, 4]
+        response = self.get_batch(ids)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        expected = []
+        for pk in [4, 1, 2, 8]:
+            url = reverse('categories-app:category-details', args=[pk])
+            expected.append(self.client.get(url).data)
+        self.assertEqual(response.data, expected)
+
+    def test_query_count_does_not_depend_on_ids(self):
+        with CaptureQueriesContext(connection) as few:
+            self.get_batch([3])
+        with CaptureQueriesContext(connection) as many:
+            self.get_batch(range(1, 9))
+        self.assertEqual(len(few), len(many))
+        self.assertLessEqual(len(many), 5)
+
+    def test_bad_ids(self):
+        for ids in ['', 'a,b', ','.join(['1'] * 101)]:
+            response = self.client.get(self.url, {'ids': ids})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchCreateTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('categories-app:category-batch')
+        self.client.post(reverse('categories-app:category-create'), TREE,
+                         format='json')
+
+    def test_creates_and_links_trees(self):
+        trees = [
+            {'name': 'Category 2', 'children': [
+                {'name': 'Category 2.1'},
+                {'name': 'Category 1.2', 'children': [
+                    {'name': 'Category 1.2.2'}]},
+            ]},
+            {'name': 'Category 1', 'children': [{'name': 'Category 1.3'}]},
+        ]
+        response = self.client.post(self.url, trees, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual(
+            [(root['name'], root['created']) for root in response.data['roots']],
+            [('Category 2', True), ('Category 1', False)])
+
+        one_two = Category.objects.get(name='Category 1.2')
+        self.assertEqual(
+            sorted(one_two.child_of.values_list('name', flat=True)),
+            ['Category 1', 'Category 2'])
+        self.assertEqual(sorted(one_two.kids.values_list('name', flat=True)),
+                         ['Category 1.2.1', 'Category 1.2.2'])
+        self.assertEqual(Category.objects.count(), 12)
+        self.assertEqual(set(CategoryClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth')), walk_kids())
+
+    def test_repeated_batch_is_a_no_op(self):
+        response = self.client.post(self.url, [TREE], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(Category.objects.count(), 8)
+
+    def test_query_count_does_not_grow_with_trees(self):
+        trees = [{'name': 'Root {}'.format(i), 'children': [
+            {'name': 'Kid {}'.format(i)}]} for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, trees, format='json')
+        self.assertEqual(response.data['created'], 100)
+        self.assertLess(len(queries), 20)
+
+    def test_invalid_payloads(self):
+        for payload in ({'name': 'Category 3'}, [], [{'children': []}],
+                        [{'name': 'Category 3', 'children': [42]}]):
+            with self.subTest(payload=payload):
+                response = self.client.post(self.url, payload, format='json')
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Category.objects.count(), 8)
+
+    def test_rejects_cycles(self):
+        response = self.client.post(self.url, [
+            {'name': 'Category 1.2.1', 'children': [{'name': 'Category 1'}]}],
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Category.objects.get(name='Category 1')
+                         .child_of.exists())
+
+    def test_node_limit(self):
+        view = resolve(self.url).func.view_class
+        trees = [{'name': 'Root {}'.format(i)}
+                 for i in range(view.max_nodes + 1)]
+        response = self.client.post(self.url, trees, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
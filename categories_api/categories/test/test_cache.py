@@ -0,0 +1,128 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.cache import (
+    LRUCache,
+    get_category_cache,
+    reset_category_cache,
+)
+from categories.models import Category
+from categories.test.utils import run_on_commit_callbacks
+
+
+CACHE_SETTINGS = {'ENABLED': True, 'LRU_SIZE': 2, 'BACKEND': 'default'}
+
+
+class LRUCacheTestCase(APITestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(2, 60)
+        lru.set(1, 'a')
+        lru.set(2, 'b')
+        lru.get(1)
+        lru.set(3, 'c')
+        self.assertEqual(lru.get(1), 'a')
+        self.assertIsNone(lru.get(2))
+        self.assertEqual(lru.get(3), 'c')
+
+    def test_expires_entries(self):
+        lru = LRUCache(2, -1)
+        lru.set(1, 'a')
+        self.assertIsNone(lru.get(1))
+        self.assertEqual(len(lru), 0)
+
+
+@override_settings(CATEGORIES_CACHE=CACHE_SETTINGS)
+class CachedRetrieveTestCase(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        reset_category_cache()
+        self.c1 = Category.objects.create(name='Category 1')
+        self.url = reverse('categories-app:category-details', args=[self.c1.pk])
+
+    def test_second_request_is_served_from_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cached.data, response.data)
+
+        stats = get_category_cache().stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['local_hits'], 1)
+
+    def test_shared_tier_refills_local_tier(self):
+        self.client.get(self.url)
+        get_category_cache().local.delete(self.c1.pk)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['name'], 'Category 1')
+        self.assertEqual(get_category_cache().stats()['shared_hits'], 1)
+        self.assertEqual(len(get_category_cache().local), 1)
+
+    def test_404_is_not_cached(self):
+        url = reverse('categories-app:category-details', args=[0])
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(get_category_cache().get(0))
+
+    def test_stats_endpoint(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        response = self.client.get(reverse('categories-app:cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['enabled'])
+        self.assertEqual(response.data['stats']['hits'], 1)
+        self.assertEqual(response.data['stats']['misses'], 1)
+
+
+class DisabledCacheTestCase(APITestCase):
+    def test_stats_endpoint(self):
+        response = self.client.get(reverse('categories-app:cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['enabled'])
+
+
+@override_settings(CATEGORIES_CACHE=CACHE_SETTINGS)
+class CacheInvalidationTestCase(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        reset_category_cache()
+
+    def test_create_invalidates_created_ids(self):
+        cache = get_category_cache()
+        cache.set(1, ('"1.1"', {'id': 1, 'name': 'stale'}))
+        cache.set(2, ('"2.1"', {'id': 2, 'name': 'stale'}))
+
+        data = {'name': 'Category 1', 'children': [{'name': 'Category 1.1'}]}
+        response = self.client.post(reverse('categories-app:category-create'),
+                                    data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(cache.get(1)[1]['name'], 'stale')
+        run_on_commit_callbacks()
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+
+        url = reverse('categories-app:category-details', args=[2])
+        response = self.client.get(url)
+        self.assertEqual(response.data['name'], 'Category 1.1')
+        self.assertEqual(response.data['parents'], [{'id': 1, 'name': 'Category 1'}])
+
+    def test_failed_create_keeps_cache(self):
+        Category.objects.create(name='Category 1.1')
+        cache = get_category_cache()
+        cache.set(1, ('"1.1"', {'id': 1, 'name': 'Category 1.1'}))
+
+        data = {'name': 'Category 1', 'children': [{'name': 'Category 1.1'}]}
+        response = self.client.post(reverse('categories-app:category-create'),
+                                    data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        run_on_commit_callbacks()
+        self.assertEqual(cache.get(1)[1]['name'], 'Category 1.1')
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category, CategoryChange
+
+
+class ChangeFeedTestCase(APITestCase):
+    url = reverse('categories-app:category-changes')
+
+    def setUp(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': 'Root', 'children': [{'name': 'A'}, {'name': 'B'}]},
+            format='json')
+        self.ids = dict(Category.objects.values_list('name', 'pk'))
+
+    def read_all(self, url, **params):
+        changes = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            changes.extend(response.data['results'])
+            if response.data['next'] is None:
+                return changes, response.data['cursor']
+            response = self.client.get(response.data['next'])
+
+    def test_create_logs_categories_and_links(self):
+        changes, _ = self.read_all(self.url)
+        self.assertEqual(
+            [(c['kind'], c['category'], c['parent'], c['name'])
+             for c in changes],
+            [('created', self.ids['Root'], None, 'Root'),
+             ('created', self.ids['A'], None, 'A'),
+             ('created', self.ids['B'], None, 'B'),
+             ('linked', self.ids['A'], self.ids['Root'], ''),
+             ('linked', self.ids['B'], self.ids['Root'], '')])
+
+    @override_settings(CATEGORIES_CHANGES={'SETTLE_SECONDS': 0})
+    def test_pages_and_cursor(self):
+        changes, cursor = self.read_all(self.url, limit=2)
+        self.assertEqual(len(changes), 5)
+
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['cursor'], cursor)
+
+        # Linking an existing category under a new parent shows up after
+        # the cursor, without logging A again.
+        self.client.post(reverse('categories-app:category-batch'), [
+            {'name': 'Other', 'children': [{'name': 'A'}]}], format='json')
+        changes, _ = self.read_all(self.url, since=cursor)
+        self.assertEqual(
+            [(c['kind'], c['category']) for c in changes],
+            [('created', Category.objects.get(name='Other').pk),
+             ('linked', self.ids['A'])])
+
+    @override_settings(CATEGORIES_CHANGES={'SETTLE_SECONDS': 60})
+    def test_cursor_waits_for_late_commits(self):
+        CategoryChange.objects.update(
+            created_at=timezone.now() - timedelta(minutes=5))
+        last = CategoryChange.objects.order_by('-pk').first().pk
+        _, cursor = self.read_all(self.url)
+
+        # The next id is still in an open transaction while a later one
+        # commits.
+        CategoryChange.objects.create(pk=last + 2, kind='created',
+                                      category=100, name='Late 2')
+        changes, cursor = self.read_all(self.url, since=cursor, limit=1)
+        self.assertEqual([c['id'] for c in changes], [last + 2])
+
+        CategoryChange.objects.create(pk=last + 1, kind='created',
+                                      category=99, name='Late 1')
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual([c['id'] for c in response.data['results']],
+                         [last + 1, last + 2])
+        self.assertIsNone(response.data['next'])
+
+    def test_rejected_create_logs_nothing(self):
+        count = CategoryChange.objects.count()
+        response = self.client.post(
+            reverse('categories-app:category-create'),
+            {'name': 'New', 'children': [{'name': 'A'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CategoryChange.objects.count(), count)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'since': '!!'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
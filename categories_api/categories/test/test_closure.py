@@ -0,0 +1,139 @@
+import json
+import random
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category, CategoryClosure
+from categories.test.utils import walk_kids
+from categories.views import stream_ndjson
+
+
+def random_tree(size, seed):
+    rnd = random.Random(seed)
+    root = {'name': 'Root', 'children': []}
+    nodes = [root]
+    for i in range(1, size):
+        node = {'name': 'Node {}'.format(i), 'children': []}
+        rnd.choice(nodes)['children'].append(node)
+        nodes.append(node)
+    return root
+
+
+class ClosureTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('categories-app:category-create')
+
+    def assertClosureMatchesKids(self):
+        actual = set(CategoryClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth'))
+        self.assertEqual(actual, walk_kids())
+
+    def test_closure_for_random_trees(self):
+        for seed in range(3):
+            Category.objects.all().delete()
+            response = self.client.post(self.url, random_tree(60, seed),
+                                        format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertClosureMatchesKids()
+
+    def test_closure_for_several_trees(self):
+        for i in range(3):
+            data = {'name': 'Category {}'.format(i),
+                    'children': [{'name': 'Category {}.1'.format(i)}]}
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertClosureMatchesKids()
+
+    def test_failed_create_leaves_no_closure_rows(self):
+        Category.objects.create(name='Category 1.1')
+        data = {'name': 'Category 1', 'children': [{'name': 'Category 1.1'}]}
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CategoryClosure.objects.count(), 0)
+
+
+class DescendantsTestCase(APITestCase):
+    def setUp(self):
+        self.url_name = 'categories-app:category-descendants'
+        data = {
+            'name': 'Category 1',
+            'children': [
+                {'name': 'Category 1.1', 'children': [
+                    {'name': 'Category 1.1.1'},
+                ]},
+                {'name': 'Category 1.2'},
+            ]
+        }
+        url = reverse('categories-app:category-create')
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_get_descendants(self):
+        url = reverse(self.url_name, args=[1])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+        self.assertEqual(response.data['id'], 1)
+        self.assertEqual(response.data['name'], 'Category 1')
+        self.assertEqual(response.data['descendants'], [
+            {'id': 2, 'name': 'Category 1.1', 'parent': 1, 'depth': 1},
+            {'id': 4, 'name': 'Category 1.2', 'parent': 1, 'depth': 1},
+            {'id': 3, 'name': 'Category 1.1.1', 'parent': 2, 'depth': 2},
+        ])
+
+    def test_get_leaf_descendants(self):
+        url = reverse(self.url_name, args=[3])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['descendants'], [])
+
+    def test_get_404(self):
+        url = reverse(self.url_name, args=[0])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SubtreeExportTestCase(DescendantsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url_name = 'categories-app:category-subtree'
+
+    def read_lines(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_get_descendants(self):
+        url = reverse(self.url_name, args=[1])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        self.assertEqual(self.read_lines(response), [
+            {'id': 1, 'name': 'Category 1', 'parent': None, 'depth': 0},
+            {'id': 2, 'name': 'Category 1.1', 'parent': 1, 'depth': 1},
+            {'id': 4, 'name': 'Category 1.2', 'parent': 1, 'depth': 1},
+            {'id': 3, 'name': 'Category 1.1.1', 'parent': 2, 'depth': 2},
+        ])
+
+    def test_get_leaf_descendants(self):
+        url = reverse(self.url_name, args=[3])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.read_lines(response), [
+            {'id': 3, 'name': 'Category 1.1.1', 'parent': None, 'depth': 0},
+        ])
+
+    def test_stream_is_chunked(self):
+        chunks = list(stream_ndjson(iter([(i, str(i), None, 0)
+                                          for i in range(5)]), 2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(
+            chunks[-1], b'{"id":4,"name":"4","parent":null,"depth":0}\n')
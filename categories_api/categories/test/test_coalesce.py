@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.test import override_settings
+from rest_framework.serializers import ValidationError
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.coalesce import get_write_coalescer
+from categories.models import Category, CategoryClosure
+
+
+COALESCING = {'ENABLED': True, 'MAX_WAIT_MS': 200, 'MAX_BATCH': 50}
+
+
+@override_settings(CATEGORIES_WRITE_COALESCING=COALESCING)
+class CoalescedCreateTestCase(APITestCase):
+    url = reverse('categories-app:category-create')
+
+    def test_create(self):
+        response = self.client.post(self.url, {
+            'name': 'Root', 'children': [{'name': 'Kid'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(get_write_coalescer().batches, 1)
+
+    def test_validation_error(self):
+        self.client.post(self.url, {'name': 'Root'}, format='json')
+        response = self.client.post(self.url, {'name': 'Root'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['name'],
+                         ['Category "Root" already exists.'])
+
+    @override_settings(CATEGORIES_WRITE_COALESCING=dict(
+        COALESCING, MAX_WAIT_MS=5000, MAX_BATCH=9))
+    def test_group_commit(self):
+        coalescer = get_write_coalescer()
+        # "Tree 3" is sent twice, so exactly one of the two is rejected.
+        names = ['Tree {}'.format(i) for i in range(8)] + ['Tree 3']
+        results = {}
+
+        def create(i, name):
+            try:
+                results[i] = coalescer.create_tree(
+                    {'name': name, 'children': [{'name': name + ' kid'}]})
+            except ValidationError as e:
+                results[i] = e
+
+        def follow(i, name):
+            # Queue up behind this thread, which leads and writes the batch
+            # on the test's own connection.
+            while coalescer.leader is None:
+                time.sleep(0.001)
+            create(i, name)
+
+        threads = [threading.Thread(target=follow, args=(i, name))
+                   for i, name in enumerate(names) if i]
+        for thread in threads:
+            thread.start()
+        create(0, names[0])
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(coalescer.batches, 1)
+        errors = [r for r in results.values() if isinstance(r, Exception)]
+        self.assertEqual(len(errors), 1)
+        self.assertIn('Tree 3', str(errors[0]))
+        self.assertEqual(
+            sorted(r.name for r in results.values()
+                   if not isinstance(r, Exception)),
+            sorted(set(names)))
+        self.assertEqual(Category.objects.count(), 16)
+        self.assertEqual(CategoryClosure.objects.count(), 24)
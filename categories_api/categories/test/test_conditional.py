@@ -0,0 +1,77 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.cache import reset_category_cache
+from categories.models import Category
+from categories.tree import touch_categories
+from categories.test.utils import run_on_commit_callbacks
+
+
+class ConditionalRetrieveTestCase(APITestCase):
+    def setUp(self):
+        self.c1 = Category.objects.create(name='Category 1')
+        c11 = Category.objects.create(name='Category 1.1')
+        self.c1.kids.add(c11)
+        self.url = reverse('categories-app:category-details', args=[self.c1.pk])
+
+    def test_response_has_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"{}.1"'.format(self.c1.pk))
+
+    def test_not_modified_before_loading_related_rows(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+
+    def test_changed_version_returns_new_payload(self):
+        etag = self.client.get(self.url)['ETag']
+        touch_categories([self.c1.pk])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"{}.2"'.format(self.c1.pk))
+        self.assertEqual(len(response.data['children']), 1)
+
+    def test_wildcard(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_404(self):
+        url = reverse('categories-app:category-details', args=[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"0.1"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CATEGORIES_CACHE={'ENABLED': True})
+class CachedConditionalRetrieveTestCase(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        reset_category_cache()
+        self.c1 = Category.objects.create(name='Category 1')
+        self.url = reverse('categories-app:category-details', args=[self.c1.pk])
+
+    def test_not_modified_from_cache(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+    def test_touch_drops_cached_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        touch_categories([self.c1.pk])
+        run_on_commit_callbacks()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"{}.2"'.format(self.c1.pk))
@@ -1,3 +1,5 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework.reverse import reverse
@@ -79,6 +81,103 @@ class CreateNestedCategoryTestCase(CreateBaseTestCase):
         self.assertIn(c2, p.kids.all())
 
 
+class CreateBulkCategoryTestCase(CreateBaseTestCase):
+    def build_tree(self, width, depth, prefix='Category 1'):
+        node = {'name': prefix}
+        if depth > 0:
+            node['children'] = [
+                self.build_tree(width, depth - 1, '{}.{}'.format(prefix, i))
+                for i in range(1, width + 1)
+            ]
+        return node
+
+    def test_query_count_does_not_depend_on_node_count(self):
+        small = self.build_tree(2, 2)
+        with CaptureQueriesContext(connection) as small_queries:
+            response = self.client.post(self.url, small, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        Category.objects.all().delete()
+
+        large = self.build_tree(4, 3)
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.post(self.url, large, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(Category.objects.count(), 1 + 4 + 16 + 64)
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_existing_child_name_rolls_back(self):
+        Category.objects.create(name='Category 1.2')
+        self.data['children'] = [{'name': 'Category 1.1'},
+                                 {'name': 'Category 1.2'}]
+
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Category.objects.count(), 1)
+
+    def test_duplicate_name_in_payload(self):
+        self.data['children'] = [{'name': 'Category 1.1'},
+                                 {'name': 'Category 1.1'}]
+
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Category.objects.count(), 0)
+
+    def test_child_without_name(self):
+        self.data['children'] = [{'children': []}]
+
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Category.objects.count(), 0)
+
+    def test_child_names_are_cleaned_like_the_root(self):
+        response = self.client.post(self.url, {
+            'name': '  Root  ',
+            'children': [{'name': '  Kid  '}, {'name': 5}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(Category.objects.values_list('name', flat=True)),
+                         {'Root', 'Kid', '5'})
+
+        response = self.client.post(self.url, {
+            'name': 'Other',
+            'children': [{'name': '   '}, {'name': True}, {'name': ' Other '}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['name'], [
+            'This field may not be blank.',
+            'Not a valid string.',
+            '"Other" is used more than once.',
+        ])
+
+    def test_reports_every_error_before_writing(self):
+        Category.objects.create(name='Category 1.3')
+        Category.objects.create(name='Category 1.4')
+        self.data['children'] = [
+            {'name': 'Category 1.1', 'children': [{'name': 'Category 1.2'}]},
+            {'name': 'Category 1.2'},
+            {'children': [{'name': 'Category 1.1'}]},
+            {'name': 'Category 1.3'},
+            {'name': 'Category 1.4', 'children': 'Category 1.5'},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'name': [
+                '"Category 1.2" is used more than once.',
+                '"name" field is required.',
+                '"Category 1.1" is used more than once.',
+                'Category "Category 1.3" already exists.',
+                'Category "Category 1.4" already exists.',
+            ],
+            'children': ['"children" must be a list.'],
+        })
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Category.objects.count(), 2)
+
+
 class RetreiveCategoryBaseTestCase(APITestCase):
     def setUp(self):
         self.url_name = 'categories-app:category-details'
@@ -145,7 +244,6 @@ class RetreiveCategoryTestCase(RetreiveCategoryBaseTestCase):
         c11 = Category.objects.create(name='Category 1.1')
         c12 = Category.objects.create(name='Category 1.2')
         self.c1.kids.add(c11, c12)
-        c12.siblings.add(c11)
 
         url = reverse(self.url_name, args=['2'])
         response = self.client.get(url)
@@ -160,6 +258,28 @@ class RetreiveCategoryTestCase(RetreiveCategoryBaseTestCase):
         self.assertEqual(response.data['siblings'][0]['name'], c12.name)
 
 
+class RetreiveDeepCategoryTestCase(RetreiveCategoryBaseTestCase):
+    def test_parents_use_single_query(self):
+        depth = 1500
+        Category.objects.bulk_create(
+            [Category(name='Category {}'.format(i)) for i in range(depth)])
+        ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        Kids = Category.kids.through
+        Kids.objects.bulk_create(
+            [Kids(from_category_id=parent, to_category_id=kid)
+             for parent, kid in zip(ids, ids[1:])])
+
+        url = reverse(self.url_name, args=[ids[-1]])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        parents = [parent['id'] for parent in response.data['parents']]
+        self.assertEqual(parents, list(reversed(ids[:-1])))
+        parent_queries = [q for q in queries if 'RECURSIVE' in q['sql']]
+        self.assertEqual(len(parent_queries), 1)
+
+
 class TaskEndToEndTestCase(APITestCase):
     def setUp(self):
         self.data = {
@@ -0,0 +1,79 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category
+
+
+def count_nodes(nodes):
+    return sum(1 + count_nodes(node.get('children', [])) for node in nodes)
+
+
+class DepthExpansionTestCase(APITestCase):
+    def setUp(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': 'Category 1', 'children': [
+                {'name': 'Category 1.{}'.format(i), 'children': [
+                    {'name': 'Category 1.{}.{}'.format(i, j), 'children': [
+                        {'name': 'Category 1.{}.{}.1'.format(i, j)}]}
+                    for j in (1, 2)]}
+                for i in (1, 2)]}, format='json')
+        self.root = Category.objects.get(name='Category 1')
+        self.url = reverse('categories-app:category-details',
+                           args=[self.root.pk])
+
+    def test_depth_one_matches_children(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, {'depth': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['children'], plain.data['children'])
+        self.assertNotIn('truncated', response.data)
+
+    def test_nested_levels(self):
+        response = self.client.get(self.url, {'depth': 2})
+        children = response.data['children']
+        self.assertEqual([kid['name'] for kid in children],
+                         ['Category 1.1', 'Category 1.2'])
+        self.assertEqual([kid['name'] for kid in children[1]['children']],
+                         ['Category 1.2.1', 'Category 1.2.2'])
+        self.assertNotIn('children', children[1]['children'][0])
+        self.assertEqual(count_nodes(children), 6)
+
+    def test_one_query_per_level(self):
+        for depth in (1, 3, 5):
+            with self.subTest(depth=depth):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(self.url, {'depth': depth})
+                self.assertEqual(count_nodes(response.data['children']),
+                                 {1: 2, 3: 10, 5: 10}[depth])
+                # Object, ancestors and siblings, then one per level; the
+                # walk stops at the first empty level.
+                self.assertEqual(len(queries), 3 + min(depth, 4))
+
+    @override_settings(CATEGORIES_EXPANSION={'MAX_DEPTH': 5, 'MAX_NODES': 4})
+    def test_node_cap(self):
+        response = self.client.get(self.url, {'depth': 3})
+        self.assertEqual(count_nodes(response.data['children']), 4)
+        self.assertIs(response.data['truncated'], True)
+
+    def test_no_etag(self):
+        response = self.client.get(self.url, {'depth': 2})
+        self.assertNotIn('ETag', response)
+
+    def test_invalid_depth(self):
+        for depth in ('0', '6', 'x'):
+            with self.subTest(depth=depth):
+                response = self.client.get(self.url, {'depth': depth})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CATEGORIES_EXPANSION={'MAX_DEPTH': 5, 'MAX_NODES': 4})
+    def test_fast_json_is_byte_identical(self):
+        kid = Category.objects.get(name='Category 1.1')
+        url = reverse('categories-app:category-details', args=[kid.pk])
+        params = {'depth': 3, 'page_size': 1}
+        expected = self.client.get(url, params).content
+        with override_settings(CATEGORIES_FAST_JSON=True):
+            self.assertEqual(self.client.get(url, params).content, expected)
@@ -0,0 +1,63 @@
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework.reverse import reverse
+from categories.models import Category
+from categories.renderers import FastJSONRenderer
+
+
+NAMES = ('Category 1', 'Catégorie 1.1', 'Категория 1.2', '"Quoted"\t\\',
+         'Emoji \U0001f600', 'Line\u2028separator')
+
+
+class FastJSONRendererTestCase(APITestCase):
+    def test_matches_json_renderer(self):
+        data = {'id': 1, 'name': NAMES[1], 'parent': None,
+                'children': [{'id': 2, 'name': name} for name in NAMES]}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_indented(self):
+        data = {'id': 1, 'name': NAMES[1]}
+        media_type = 'application/json; indent=4'
+        self.assertEqual(FastJSONRenderer().render(data, media_type),
+                         JSONRenderer().render(data, media_type))
+
+
+class FastJSONResponsesTestCase(APITestCase):
+    def setUp(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': NAMES[0], 'children': [
+                {'name': NAMES[1], 'children': [{'name': NAMES[3]}]},
+                {'name': NAMES[2]},
+                {'name': NAMES[4]},
+                {'name': NAMES[5]},
+            ]}, format='json')
+        self.ids = list(Category.objects.order_by('pk')
+                        .values_list('pk', flat=True))
+
+    def fetch_all(self):
+        urls = []
+        for pk in self.ids + [0]:
+            urls.append(reverse('categories-app:category-details', args=[pk]))
+            urls.append(reverse('categories-app:category-descendants',
+                                args=[pk]))
+        batch = reverse('categories-app:category-batch')
+        urls.append(batch + '?ids=' + ','.join(map(str, self.ids)))
+        urls.append(batch + '?ids=x')
+        search = reverse('categories-app:category-search')
+        urls.append(search + '?q=cat')
+        return [(self.client.get(url).status_code,
+                 self.client.get(url).content) for url in urls]
+
+    def test_output_is_byte_identical(self):
+        expected = self.fetch_all()
+        with override_settings(CATEGORIES_FAST_JSON=True):
+            self.assertEqual(self.fetch_all(), expected)
+
+    def test_skips_serializers(self):
+        url = reverse('categories-app:category-details', args=[self.ids[1]])
+        with override_settings(CATEGORIES_FAST_JSON=True):
+            response = self.client.get(url)
+        self.assertIs(type(response.data), dict)
+        self.assertNotIn('serialize', response['Server-Timing'])
@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import HIERARCHY_FIELDS, Category
+from categories.test.utils import walk_kids
+from categories.tree import merge_nodes
+
+
+def expected_hierarchy():
+    """Brute force: counts from a walk of ``kids``, depth from the chain of
+    lowest-id parents."""
+    descendants = {}
+    for ancestor, descendant, depth in walk_kids():
+        if depth:
+            descendants.setdefault(ancestor, set()).add(descendant)
+    expected = {}
+    for category in Category.objects.all():
+        depth = 0
+        node = category
+        while node.child_of.exists():
+            node = node.child_of.order_by('pk').first()
+            depth += 1
+        expected[category.pk] = (depth, category.kids.count(),
+                                 len(descendants.get(category.pk, ())))
+    return expected
+
+
+def stored_hierarchy():
+    return {row[0]: row[1:] for row in
+            Category.objects.values_list('pk', *HIERARCHY_FIELDS)}
+
+
+class HierarchyCountersTestCase(APITestCase):
+    def setUp(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': 'Category 1', 'children': [
+                {'name': 'Category 1.1', 'children': [
+                    {'name': 'Category 1.1.1'}, {'name': 'Category 1.1.2'}]},
+                {'name': 'Category 1.2'},
+            ]}, format='json')
+
+    def test_create_sets_counters(self):
+        self.assertEqual(stored_hierarchy(), expected_hierarchy())
+        root = Category.objects.get(name='Category 1')
+        self.assertEqual((root.depth, root.children_count,
+                          root.descendants_count), (0, 2, 4))
+
+    def test_batch_create_updates_counters(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': 'Category 2', 'children': [{'name': 'Category 2.1'}]},
+            format='json')
+        response = self.client.post(reverse('categories-app:category-batch'), [
+            # Re-link an existing subtree and grow it.
+            {'name': 'Category 2.1', 'children': [
+                {'name': 'Category 1.1', 'children': [
+                    {'name': 'Category 1.1.3'}]}]},
+            # A new root above an existing one moves the whole tree down.
+            {'name': 'Category 0', 'children': [{'name': 'Category 1'}]},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(stored_hierarchy(), expected_hierarchy())
+
+    def test_diamond_links_count_descendants_once(self):
+        # Both subtrees are already under Category 1; linking them to each
+        # other adds descendants to Category 1.2 only.
+        merge_nodes([('Category 1.1', 'Category 1.2'),
+                     ('Category 1.1.1', 'Category 1.2')])
+        self.assertEqual(stored_hierarchy(), expected_hierarchy())
+        root = Category.objects.get(name='Category 1')
+        self.assertEqual(root.descendants_count, 4)
+
+    def test_detail_exposes_counters(self):
+        pk = Category.objects.get(name='Category 1.1').pk
+        response = self.client.get(
+            reverse('categories-app:category-details', args=[pk]))
+        self.assertEqual(
+            [response.data[field] for field in HIERARCHY_FIELDS], [1, 2, 2])
+
+    def test_repair_command(self):
+        Category.objects.filter(name='Category 1').update(
+            descendants_count=0, depth=7)
+        Category.objects.filter(name='Category 1.2').update(children_count=3)
+        version = Category.objects.get(name='Category 1').version
+
+        out = StringIO()
+        call_command('repair_hierarchy', '--dry-run', stdout=out)
+        self.assertIn('2 of 5 categories wrong', out.getvalue())
+        self.assertNotEqual(stored_hierarchy(), expected_hierarchy())
+
+        out = StringIO()
+        call_command('repair_hierarchy', stdout=out)
+        self.assertIn('2 of 5 categories repaired', out.getvalue())
+        self.assertEqual(stored_hierarchy(), expected_hierarchy())
+        self.assertEqual(Category.objects.get(name='Category 1').version,
+                         version + 1)
@@ -0,0 +1,271 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.serializers import ValidationError
+from rest_framework.test import APITestCase
+from categories.management.commands.import_categories import (
+    iter_json_tree_records,
+)
+from categories.models import Category, CategoryClosure
+from categories.tree import merge_nodes
+from categories.test.utils import walk_kids
+
+
+class ImportBaseTestCase(APITestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text, compress=False):
+        path = os.path.join(self.tmp, name)
+        opener = gzip.open if compress else open
+        with opener(path, 'wt') as f:
+            f.write(text)
+        return path
+
+    def run_import(self, path, *args):
+        out = io.StringIO()
+        call_command('import_categories', path, *args, stdout=out)
+        return out.getvalue()
+
+    def assertClosureMatchesKids(self):
+        actual = set(CategoryClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth'))
+        self.assertEqual(actual, walk_kids())
+
+
+class ImportCategoriesTestCase(ImportBaseTestCase):
+    def test_ndjson_across_batches(self):
+        lines = [
+            {'name': 'Category 1'},
+            {'name': 'Category 1.1', 'parent': 'Category 1'},
+            {'name': 'Category 1.2', 'parent': 'Category 1'},
+            {'name': 'Category 1.1.1', 'parent': 'Category 1.1'},
+            {'name': 'Category 1.1.1.1', 'parent': 'Category 1.1.1'},
+        ]
+        path = self.write('tree.ndjson',
+                          '\n'.join(json.dumps(line) for line in lines))
+
+        out = self.run_import(path, '--batch-size', '2')
+        self.assertIn('rows/s', out)
+        self.assertIn('Imported 5 records (5 new categories)', out)
+
+        c1 = Category.objects.get(name='Category 1')
+        self.assertEqual(set(c1.kids.values_list('name', flat=True)),
+                         {'Category 1.1', 'Category 1.2'})
+        c1111 = Category.objects.get(name='Category 1.1.1.1')
+        self.assertEqual(c1111.child_of.get().name, 'Category 1.1.1')
+        self.assertClosureMatchesKids()
+
+    def test_nested_json_gzip(self):
+        trees = [
+            {'name': 'Category 1', 'children': [
+                {'name': 'Category 1.1', 'children': [{'name': 'Category 1.1.1'}]},
+                {'name': 'Category 1.2'},
+            ]},
+            {'name': 'Category 2', 'children': [{'name': 'Category 2.1'}]},
+        ]
+        path = self.write('trees.json.gz', json.dumps(trees, indent=2),
+                          compress=True)
+
+        self.run_import(path, '--batch-size', '3')
+        self.assertEqual(Category.objects.count(), 6)
+        c11 = Category.objects.get(name='Category 1.1')
+        self.assertEqual([s.name for s in c11.siblings], ['Category 1.2'])
+        self.assertClosureMatchesKids()
+
+    def test_reimport_links_existing_categories(self):
+        path = self.write('a.ndjson', '{"name": "A"}\n{"name": "B"}\n'
+                                      '{"name": "B.1", "parent": "B"}\n')
+        self.run_import(path)
+        path = self.write('b.ndjson', '{"name": "B", "parent": "A"}\n'
+                                      '{"name": "B.1", "parent": "B"}\n')
+
+        out = self.run_import(path)
+        self.assertIn('(0 new categories)', out)
+        a = Category.objects.get(name='A')
+        self.assertEqual([c.name for c in a.kids.all()], ['B'])
+        self.assertEqual(Category.objects.get(name='B.1').child_of.count(), 1)
+        self.assertClosureMatchesKids()
+
+    def test_cycle_is_rejected(self):
+        path = self.write('a.ndjson', '{"name": "A"}\n'
+                                      '{"name": "B", "parent": "A"}\n')
+        self.run_import(path)
+        path = self.write('b.ndjson', '{"name": "A", "parent": "B"}\n')
+
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+        self.assertEqual(Category.objects.get(name='A').child_of.count(), 0)
+
+    def test_cycle_through_new_links_is_rejected(self):
+        merge_nodes([('A', None), ('B', None), ('C', None)])
+        with self.assertRaises(ValidationError):
+            merge_nodes([('B', 'A'), ('C', 'B'), ('A', 'C')])
+        self.assertEqual(Category.kids.through.objects.count(), 0)
+
+    def test_links_existing_categories_in_bulk(self):
+        names = ['Category {}'.format(i) for i in range(64)]
+        merge_nodes((name, None) for name in names)
+        # One batch chains all of them, so most closure rows only appear
+        # through several of the new links.
+        records = list(zip(names[1:], names))
+        with CaptureQueriesContext(connection) as queries:
+            merge_nodes(records)
+        self.assertLess(len(queries), 40)
+        self.assertEqual(Category.objects.get(name=names[0])
+                         .descendants_count, 63)
+        self.assertClosureMatchesKids()
+
+    def test_unknown_parent(self):
+        path = self.write('a.ndjson', '{"name": "A", "parent": "Nope"}\n')
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+        self.assertEqual(Category.objects.count(), 0)
+
+    def test_bad_line(self):
+        path = self.write('a.ndjson', '{"name": "A"}\n{"name": \n')
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+
+
+class IterJsonTreeRecordsTestCase(APITestCase):
+    def records(self, text, read_size=None):
+        stream = io.StringIO(text)
+        if read_size:
+            stream.read = lambda size, read=stream.read: read(read_size)
+        return list(iter_json_tree_records(stream))
+
+    def test_small_reads(self):
+        trees = [{'name': 'Category {}'.format(i), 'extra': [1.5, None, {}],
+                  'children': [{'name': 'Kid "{}"'.format(i)}]}
+                 for i in range(20)]
+        expected = []
+        for i in range(20):
+            expected.append(('Category {}'.format(i), None))
+            expected.append(('Kid "{}"'.format(i), 'Category {}'.format(i)))
+        for read_size in (1, 7, 64):
+            self.assertEqual(self.records(json.dumps(trees), read_size),
+                             expected)
+
+    def test_single_object(self):
+        self.assertEqual(self.records(' {"name": "A"} '), [('A', None)])
+
+    def test_name_after_children(self):
+        text = json.dumps({'children': [
+            {'children': [{'name': 'C'}], 'name': 'B'}], 'name': 'A'})
+        self.assertEqual(self.records(text, 3),
+                         [('A', None), ('B', 'A'), ('C', 'B')])
+
+    def test_deep_tree(self):
+        # Too deep for json.dumps().
+        text = ''.join('{{"name": "Node {}", "children": ['.format(i)
+                       for i in range(5000)) + ']}' * 5000
+        records = self.records(text)
+        self.assertEqual(len(records), 5000)
+        self.assertEqual(records[-1], ('Node 4999', 'Node 4998'))
+
+    def test_invalid_input(self):
+        for text in ('{"name": "A"', '[{"name": "A"},]', '{"name": "A"} x',
+                     '{"name" "A"}', '"A"', '[1]', '{"children": []}',
+                     '{"name": "A", "children": {}}'):
+            with self.subTest(text=text):
+                with self.assertRaises((ValueError, ValidationError)):
+                    self.records(text)
+
+
+class ExportCategoriesTestCase(ImportBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        data = {
+            'name': 'Category 1',
+            'children': [
+                {'name': 'Category 1.1', 'children': [
+                    {'name': 'Category 1.1.1'},
+                ]},
+                {'name': 'Category 1.2'},
+            ]
+        }
+        response = self.client.post(reverse('categories-app:category-create'),
+                                    data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_export_to_stdout(self):
+        out = io.StringIO()
+        call_command('export_categories', stdout=out, stderr=io.StringIO())
+        self.assertEqual(
+            [json.loads(line) for line in out.getvalue().splitlines()], [
+                {'name': 'Category 1'},
+                {'name': 'Category 1.1', 'parent': 'Category 1'},
+                {'name': 'Category 1.2', 'parent': 'Category 1'},
+                {'name': 'Category 1.1.1', 'parent': 'Category 1.1'},
+            ])
+
+    def test_round_trip(self):
+        Category.objects.get(name='Category 1.2').kids.add(
+            Category.objects.get(name='Category 1.1.1'))
+        expected = set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name'))
+        path = os.path.join(self.tmp, 'dump.ndjson.gz')
+        call_command('export_categories', path, '--chunk-size', '2',
+                     stderr=io.StringIO())
+        Category.objects.all().delete()
+
+        self.run_import(path, '--batch-size', '2')
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertEqual(set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name')), expected)
+
+    def test_round_trip_with_parent_deeper_than_kid(self):
+        # K hangs off A, then gets P three levels down as a second parent,
+        # so no ordering by depth puts P first.
+        merge_nodes([('A', None), ('K', 'A'), ('B', 'A'), ('C', 'B'),
+                     ('P', 'C')])
+        merge_nodes([('K', 'P')])
+        expected = set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name'))
+        path = os.path.join(self.tmp, 'dump.ndjson')
+        call_command('export_categories', path, stderr=io.StringIO())
+        Category.objects.all().delete()
+
+        self.run_import(path, '--batch-size', '1')
+        self.assertEqual(Category.objects.count(), 9)
+        self.assertEqual(set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name')), expected)
+        self.assertClosureMatchesKids()
+        self.assertEqual(Category.objects.get(name='K').depth, 1)
+
+    def test_round_trip_queries_are_bounded(self):
+        tree = {'name': 'Root', 'children': [
+            {'name': 'Node {}'.format(i), 'children': [
+                {'name': 'Node {}.{}'.format(i, j)} for j in range(9)]}
+            for i in range(20)]}
+        self.client.post(reverse('categories-app:category-create'), tree,
+                         format='json')
+        merge_nodes([('Node 0.0', 'Node 1'), ('Node 1', 'Node 2.3'),
+                     ('Category 1.1.1', 'Node 5.5')])
+        expected = set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name'))
+        path = os.path.join(self.tmp, 'dump.ndjson')
+        call_command('export_categories', path, stderr=io.StringIO())
+        Category.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import(path, '--batch-size', '100')
+        # 205 categories in three batches; a query per link would be
+        # several hundred.
+        self.assertLess(len(queries), 75)
+        self.assertEqual(set(Category.kids.through.objects.values_list(
+            'from_category__name', 'to_category__name')), expected)
+        self.assertClosureMatchesKids()
@@ -0,0 +1,30 @@
+from django.test import TransactionTestCase, override_settings
+
+from categories.loadtest import percentile, run_load, summarize
+from categories.models import Category
+
+
+class LoadTestTestCase(TransactionTestCase):
+    @override_settings(ALLOWED_HOSTS=['127.0.0.1'])
+    def test_in_process_threads(self):
+        samples, seconds = run_load(workers=2, requests=10, write_ratio=0.5,
+                                    tree_size=3, seed_trees=2)
+        report = summarize(samples, seconds)
+        self.assertEqual(report['all']['requests'], 10)
+        self.assertEqual(
+            report['create']['requests'] + report['retrieve']['requests'], 10)
+        # The shared in-memory test database fails on table locks right
+        # away, so concurrent writes may well hit some; they must be the
+        # only errors and all be reported as such.
+        statuses = report['all']['statuses']
+        self.assertLessEqual(set(statuses), {200, 201, 500})
+        self.assertEqual(report['all']['lock_errors'], statuses.get(500, 0))
+        self.assertEqual(Category.objects.count(),
+                         3 * (2 + report['create']['statuses'].get(201, 0)))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+        self.assertIsNone(percentile([], 0.5))
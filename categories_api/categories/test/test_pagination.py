@@ -0,0 +1,85 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category
+from categories.views import kid_page
+
+
+class DetailPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.client.post(reverse('categories-app:category-create'), {
+            'name': 'Hub', 'children': [
+                {'name': 'Kid {}'.format(i)} for i in range(7)]},
+            format='json')
+        self.hub = Category.objects.get(name='Hub')
+        self.kids = list(Category.objects.exclude(pk=self.hub.pk)
+                         .order_by('pk').values_list('pk', flat=True))
+        self.url = reverse('categories-app:category-details',
+                           args=[self.hub.pk])
+
+    def follow(self, url, field):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data[field]), 3)
+            ids.extend(node['id'] for node in response.data[field])
+            url = response.data[field + '_next']
+            pages += 1
+        return ids, pages
+
+    def test_children_pages(self):
+        ids, pages = self.follow(self.url + '?page_size=3', 'children')
+        self.assertEqual(ids, self.kids)
+        self.assertEqual(pages, 3)
+
+    def test_siblings_pages(self):
+        url = reverse('categories-app:category-details', args=[self.kids[0]])
+        ids, pages = self.follow(url + '?page_size=3', 'siblings')
+        self.assertEqual(ids, self.kids[1:])
+        self.assertEqual(pages, 2)
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['children']), 7)
+        self.assertNotIn('children_next', response.data)
+
+    @override_settings(CATEGORIES_PAGINATION={'ENABLED': True,
+                                              'PAGE_SIZE': 5})
+    def test_enabled_in_settings(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['children']), 5)
+        self.assertIsNotNone(response.data['children_next'])
+        self.assertIsNone(response.data['siblings_next'])
+
+    def test_first_page_queries(self):
+        url = reverse('categories-app:category-details', args=[self.kids[0]])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url + '?page_size=1')
+        # Category, ancestors and parent ids, then the children page and a
+        # siblings page per parent.
+        self.assertEqual(len(queries), 5)
+        self.assertTrue(all('LIMIT 2' in query['sql']
+                            for query in queries[-2:]))
+
+    def test_pages_follow_kids_index(self):
+        # Sorting every kid in a temporary B-tree makes the first page cost
+        # as much as the whole list.
+        query, params = (kid_page(self.hub.pk, 0, self.hub.pk)[:3]
+                         .query.sql_with_params())
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_invalid_parameters(self):
+        for query in ('?page_size=0', '?page_size=x', '?page_size=1001',
+                      '?children_cursor=%%%', '?siblings_cursor=eA=='):
+            with self.subTest(query=query):
+                response = self.client.get(self.url + query)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
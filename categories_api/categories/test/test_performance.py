@@ -0,0 +1,140 @@
+"""Benchmarks with query budgets for creating and reading category trees.
+
+Every case runs as part of the normal test suite and fails when an
+endpoint goes over its query budget. Set CATEGORIES_BENCH_OUTPUT to a file
+name to also get wall times and query counts as JSON.
+"""
+import json
+import math
+import os
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category, CategoryClosure
+
+
+def wide_tree(size):
+    """One root with ``size - 1`` kids."""
+    return {'name': 'Wide 0', 'children': [
+        {'name': 'Wide {}'.format(i)} for i in range(1, size)]}
+
+
+def deep_tree(size):
+    """A single chain ``size`` categories deep."""
+    root = node = {'name': 'Deep 0'}
+    for i in range(1, size):
+        kid = {'name': 'Deep {}'.format(i)}
+        node['children'] = [kid]
+        node = kid
+    return root
+
+
+def bushy_tree(size, branching=3):
+    """Breadth-first filled tree of ``size`` categories."""
+    nodes = [{'name': 'Bushy 0'}]
+    for i in range(1, size):
+        kid = {'name': 'Bushy {}'.format(i)}
+        nodes[(i - 1) // branching].setdefault('children', []).append(kid)
+        nodes.append(kid)
+    return nodes[0]
+
+
+SHAPES = {
+    'wide': (wide_tree, (10, 100, 1000)),
+    'deep': (deep_tree, (10, 50, 200)),
+    'bushy': (bushy_tree, (10, 100, 1000)),
+}
+
+
+def create_budget(nodes, closure_rows):
+    # Validation plus a savepoint pair, then one batched statement per few
+    # hundred categories, kids rows, change log rows and closure rows.
+    return 3 + 4 * math.ceil(nodes / 250) + math.ceil(closure_rows / 150)
+
+
+RETRIEVE_BUDGET = 4
+BATCH_RETRIEVE_BUDGET = 5
+DESCENDANTS_BUDGET = 1
+
+
+class PerformanceTestCase(APITestCase):
+    results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        path = os.environ.get('CATEGORIES_BENCH_OUTPUT')
+        if path:
+            with open(path, 'w') as f:
+                json.dump(cls.results, f, indent=2)
+
+    def measure(self, shape, size, operation, budget, request):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request()
+            seconds = time.perf_counter() - started
+        self.results.append({
+            'shape': shape,
+            'size': size,
+            'operation': operation,
+            'seconds': round(seconds, 6),
+            'queries': len(queries),
+            'budget': budget,
+        })
+        self.assertLessEqual(
+            len(queries), budget,
+            '{} on {} tree of {} went over its query budget'.format(
+                operation, shape, size))
+        return response
+
+    def test_create_and_retrieve(self):
+        for shape, (build, sizes) in SHAPES.items():
+            for size in sizes:
+                with self.subTest(shape=shape, size=size):
+                    self.run_case(shape, build, size)
+
+    def run_case(self, shape, build, size):
+        Category.objects.all().delete()
+        tree = build(size)
+        closure_rows = self.count_closure_rows(tree)
+
+        response = self.measure(
+            shape, size, 'create', create_budget(size, closure_rows),
+            lambda: self.client.post(reverse('categories-app:category-create'),
+                                     tree, format='json'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CategoryClosure.objects.count(), closure_rows)
+
+        ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        for label, pk in (('root', ids[0]), ('middle', ids[len(ids) // 2]),
+                          ('leaf', ids[-1])):
+            url = reverse('categories-app:category-details', args=[pk])
+            response = self.measure(shape, size, 'retrieve ' + label,
+                                    RETRIEVE_BUDGET,
+                                    lambda: self.client.get(url))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = reverse('categories-app:category-batch')
+        response = self.measure(
+            shape, size, 'batch retrieve', BATCH_RETRIEVE_BUDGET,
+            lambda: self.client.get(url, {'ids': ','.join(map(str, ids[:100]))}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = reverse('categories-app:category-descendants', args=[ids[0]])
+        response = self.measure(shape, size, 'descendants', DESCENDANTS_BUDGET,
+                                lambda: self.client.get(url))
+        self.assertEqual(len(response.data['descendants']), size - 1)
+
+    @staticmethod
+    def count_closure_rows(tree):
+        rows = 0
+        stack = [(tree, 1)]
+        while stack:
+            node, depth = stack.pop()
+            rows += depth
+            stack.extend((kid, depth + 1) for kid in node.get('children', []))
+        return rows
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.db import connections, router
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category
+from categories.routers import pin_to_primary
+
+
+REPLICA_SETTINGS = {'ALIASES': ['replica'], 'STICKY_SECONDS': 60}
+
+
+@contextmanager
+def outside_transaction():
+    """Route reads as outside of the transaction wrapping every test."""
+    connection = connections['default']
+    atomic, connection.in_atomic_block = connection.in_atomic_block, False
+    try:
+        yield
+    finally:
+        connection.in_atomic_block = atomic
+
+
+@override_settings(CATEGORIES_REPLICAS=REPLICA_SETTINGS)
+class ReplicaRouterTestCase(APITestCase):
+    def tearDown(self):
+        pin_to_primary(False)
+
+    def test_reads_go_to_replica(self):
+        with outside_transaction():
+            self.assertEqual(router.db_for_read(Category), 'replica')
+            self.assertEqual(router.db_for_write(Category), 'default')
+
+    def test_pinned_reads_go_to_primary(self):
+        pin_to_primary()
+        with outside_transaction():
+            self.assertEqual(router.db_for_read(Category), 'default')
+
+    def test_reads_in_transaction_go_to_primary(self):
+        self.assertEqual(router.db_for_read(Category), 'default')
+
+    @override_settings(CATEGORIES_REPLICAS={'ALIASES': []})
+    def test_without_replicas(self):
+        with outside_transaction():
+            self.assertEqual(router.db_for_read(Category), 'default')
+
+
+@override_settings(CATEGORIES_REPLICAS=REPLICA_SETTINGS)
+class ReplicaReadYourWritesTestCase(APITestCase):
+    """Runs against a second SQLite file that never receives the writes,
+    i.e. a replica lagging behind for the whole test."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        connections.databases['replica'] = dict(
+            connections.databases['default'],
+            NAME=os.path.join(cls.tmp, 'replica.db'))
+        call_command('migrate', 'categories', database='replica',
+                     verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections.databases['replica']
+        del connections._connections.replica
+        shutil.rmtree(cls.tmp)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.response = self.client.post(
+            reverse('categories-app:category-create'), {'name': 'Category 1'},
+            format='json')
+        pk = Category.objects.using('default').get().pk
+        self.url = reverse('categories-app:category-details', args=[pk])
+
+    def get(self):
+        with outside_transaction():
+            return self.client.get(self.url)
+
+    def test_reads_follow_own_writes(self):
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('categories_primary', self.response.cookies)
+
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Category 1')
+
+    def test_other_clients_read_replica(self):
+        self.client.cookies.clear()
+        self.assertEqual(self.get().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_expired_cookie_reads_replica(self):
+        self.client.cookies['categories_primary'] = '0'
+        self.assertEqual(self.get().status_code, status.HTTP_404_NOT_FOUND)
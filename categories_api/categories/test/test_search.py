@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('categories-app:category-search')
+        data = {
+            'name': 'Books',
+            'children': [
+                {'name': 'Book  Covers'},
+                {'name': 'Bookmarks'},
+                {'name': 'Boots'},
+                {'name': 'E-books'},
+            ]
+        }
+        response = self.client.post(reverse('categories-app:category-create'),
+                                    data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def search(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_prefix_is_case_and_space_insensitive(self):
+        response = self.search(q='BOOK ')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['name'] for c in response.data],
+                         ['Book  Covers'])
+
+        response = self.search(q='book')
+        self.assertEqual([c['name'] for c in response.data],
+                         ['Book  Covers', 'Bookmarks', 'Books'])
+
+    def test_limit(self):
+        response = self.search(q='b', limit=2)
+        self.assertEqual([c['name'] for c in response.data],
+                         ['Book  Covers', 'Bookmarks'])
+
+    def test_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search(q='bo')
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(queries), 1)
+
+    def test_orm_created_category(self):
+        Category.objects.create(name='Bottles')
+        response = self.search(q='bott')
+        self.assertEqual([c['name'] for c in response.data], ['Bottles'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search(q='zz').data, [])
+
+    def test_bad_request(self):
+        for params in ({}, {'q': '  '}, {'q': 'b', 'limit': 0},
+                       {'q': 'b', 'limit': 'x'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
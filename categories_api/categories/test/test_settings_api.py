@@ -0,0 +1,19 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+class SettingsBenchmarkTestCase(SimpleTestCase):
+    def test_profiles_serve_requests(self):
+        out = StringIO()
+        call_command('settings_benchmark', runs=1, requests=5, json=True,
+                     stdout=out)
+        report = json.loads(out.getvalue())
+        full = report['categories_api.settings']
+        lean = report['categories_api.settings_api']
+        self.assertGreater(full['request_us_p50'], 0)
+        self.assertGreater(lean['request_us_p50'], 0)
+        # Sessions, messages and auth models are never imported.
+        self.assertLess(lean['modules'], full['modules'])
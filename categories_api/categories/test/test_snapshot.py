@@ -0,0 +1,222 @@
+import threading
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category, CategoryChange
+from categories.snapshot import get_snapshot, reset_snapshot
+from categories.tree import merge_nodes
+from categories.test.utils import run_on_commit_callbacks
+
+
+SNAPSHOT_SETTINGS = {'ENABLED': True, 'REFRESH_INTERVAL': 60}
+
+
+class SnapshotTestCase(APITestCase):
+    def setUp(self):
+        reset_snapshot()
+        self.tree = {'name': 'Category 1', 'children': [
+            {'name': 'Category 1.1', 'children': [
+                {'name': 'Category 1.1.1'},
+                {'name': 'Category 1.1.2'},
+            ]},
+            {'name': 'Category 1.2'},
+        ]}
+        self.client.post(reverse('categories-app:category-create'),
+                         self.tree, format='json')
+        self.ids = list(Category.objects.order_by('pk')
+                        .values_list('pk', flat=True))
+
+    def tearDown(self):
+        reset_snapshot()
+
+    def fetch_all(self):
+        responses = {}
+        for pk in self.ids:
+            for name in ('category-details', 'category-descendants'):
+                url = reverse('categories-app:' + name, args=[pk])
+                responses[name, pk] = self.client.get(url).data
+        url = reverse('categories-app:category-batch')
+        responses['batch'] = self.client.get(
+            url, {'ids': ','.join(map(str, self.ids))}).data
+        return responses
+
+    def test_matches_database_responses(self):
+        expected = self.fetch_all()
+        with override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS):
+            self.assertEqual(self.fetch_all(), expected)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_loaded_when_app_starts(self):
+        apps.get_app_config('categories').ready()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNotNone(get_snapshot())
+        self.assertEqual(len(queries), 0)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_serves_reads_without_queries(self):
+        get_snapshot()
+        for name in ('category-details', 'category-descendants'):
+            url = reverse('categories-app:' + name, args=[self.ids[1]])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(queries), 0)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_etag_follows_version(self):
+        url = reverse('categories-app:category-details', args=[self.ids[1]])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(etag, '"{}.1"'.format(self.ids[1]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_picks_up_writes_incrementally(self):
+        snapshot = get_snapshot()
+        merge_nodes([('Category 1.2.1', 'Category 1.2'),
+                     ('Category 1.1.1', 'Category 1.2')])
+        run_on_commit_callbacks()
+
+        url = reverse('categories-app:category-details', args=[self.ids[4]])
+        response = self.client.get(url)
+        self.assertEqual([kid['name'] for kid in response.data['children']],
+                         ['Category 1.1.1', 'Category 1.2.1'])
+        version = Category.objects.get(pk=self.ids[4]).version
+        self.assertEqual(response['ETag'],
+                         '"{}.{}"'.format(self.ids[4], version))
+        root = reverse('categories-app:category-details', args=[self.ids[0]])
+        self.assertEqual(self.client.get(root).data['descendants_count'], 5)
+        # Two new links on four: over REBUILD_RATIO, so they were folded
+        # into the CSR arrays.
+        self.assertEqual(snapshot.extra_kids, {})
+        self.assertEqual(len(snapshot.kid_targets), 6)
+        self.assertIs(get_snapshot(), snapshot)
+
+    @override_settings(CATEGORIES_SNAPSHOT=dict(SNAPSHOT_SETTINGS,
+                                                REBUILD_RATIO=10))
+    def test_keeps_new_links_in_overlay(self):
+        snapshot = get_snapshot()
+        self.client.post(reverse('categories-app:category-create'),
+                         {'name': 'Category 2', 'children': [
+                             {'name': 'Category 2.1'}]}, format='json')
+        run_on_commit_callbacks()
+
+        pk = Category.objects.get(name='Category 2').pk
+        url = reverse('categories-app:category-details', args=[pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([kid['name'] for kid in response.data['children']],
+                         ['Category 2.1'])
+        self.assertEqual(len(snapshot.links), 1)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_falls_back_to_database_for_unknown_ids(self):
+        get_snapshot()
+        obj = Category.objects.create(name='Category 2')
+        url = reverse('categories-app:category-details', args=[obj.pk])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        url = reverse('categories-app:category-details', args=[obj.pk + 1])
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_picks_up_repaired_rows(self):
+        snapshot = get_snapshot()
+        # As if repair_hierarchy ran in another process: nothing marks this
+        # snapshot stale, the next periodic refresh finds the change log.
+        Category.objects.filter(pk=self.ids[1]).update(descendants_count=9)
+        call_command('repair_hierarchy', stdout=StringIO())
+        snapshot.refresh()
+
+        url = reverse('categories-app:category-details', args=[self.ids[1]])
+        response = self.client.get(url)
+        self.assertEqual(response.data['descendants_count'], 2)
+        self.assertEqual(response['ETag'], '"{}.2"'.format(self.ids[1]))
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_picks_up_late_commits(self):
+        snapshot = get_snapshot()
+        root, last = self.ids[0], self.ids[-1]
+        change = CategoryChange.objects.order_by('-pk').first().pk
+        # Category last + 1 and its change log rows commit after last + 2
+        # and its rows were read.
+        Category.objects.create(pk=last + 2, name='Late 2')
+        CategoryChange.objects.create(pk=change + 3, kind='created',
+                                      category=last + 2, name='Late 2')
+        snapshot.refresh()
+        Category.objects.create(pk=last + 1, name='Late 1')
+        Category.kids.through.objects.create(from_category_id=root,
+                                             to_category_id=last + 1)
+        CategoryChange.objects.create(pk=change + 1, kind='created',
+                                      category=last + 1, name='Late 1')
+        CategoryChange.objects.create(pk=change + 2, kind='linked',
+                                      category=last + 1, parent=root)
+        snapshot.refresh()
+
+        url = reverse('categories-app:category-details', args=[root])
+        self.assertEqual(
+            [kid['name'] for kid in self.client.get(url).data['children']],
+            ['Category 1.1', 'Category 1.2', 'Late 1'])
+        for pk, name in ((last + 1, 'Late 1'), (last + 2, 'Late 2')):
+            self.assertEqual(snapshot.detail(pk)[1]['name'], name)
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_skips_links_to_missing_categories(self):
+        snapshot = get_snapshot()
+        # Linked to a category created without a change, and to one that
+        # no longer exists.
+        obj = Category.objects.create(name='Category 2')
+        CategoryChange.objects.create(kind='linked', category=obj.pk,
+                                      parent=self.ids[0])
+        Category.kids.through.objects.create(from_category_id=self.ids[0],
+                                             to_category_id=obj.pk)
+        CategoryChange.objects.create(kind='linked', category=obj.pk + 1,
+                                      parent=self.ids[0])
+        snapshot.refresh()
+
+        url = reverse('categories-app:category-details', args=[self.ids[0]])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([kid['name'] for kid in response.data['children']],
+                         ['Category 1.1', 'Category 1.2', 'Category 2'])
+
+    @override_settings(CATEGORIES_SNAPSHOT=SNAPSHOT_SETTINGS)
+    def test_reads_do_not_wait_for_refresh(self):
+        snapshot = get_snapshot()
+        started, release = threading.Event(), threading.Event()
+
+        def fetch_changes():
+            started.set()
+            release.wait(5)
+            return []
+
+        snapshot.fetch_changes = fetch_changes
+        snapshot.stale = True
+        thread = threading.Thread(target=snapshot.refresh_if_needed)
+        thread.start()
+        try:
+            started.wait(5)
+            with CaptureQueriesContext(connection) as queries:
+                _, data = snapshot.detail(self.ids[1])
+            self.assertEqual(data['name'], 'Category 1.1')
+            self.assertEqual(len(queries), 0)
+            # Served while the refresh is still waiting on the database.
+            self.assertTrue(thread.is_alive())
+        finally:
+            release.set()
+            thread.join()
+
+    def test_footprint_command(self):
+        out = StringIO()
+        call_command('snapshot_footprint', stdout=out)
+        output = out.getvalue()
+        self.assertIn('5 categories, 4 links', output)
+        self.assertIn('kid_targets', output)
+        self.assertIn('total', output)
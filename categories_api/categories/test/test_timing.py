@@ -0,0 +1,48 @@
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from categories.models import Category
+from categories.timing import Histogram, registry
+
+
+class HistogramTestCase(APITestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for ms in [0.1] * 90 + [15] * 9 + [10000]:
+            histogram.observe(ms)
+        self.assertEqual(histogram.percentile(0.5), 0.5)
+        self.assertEqual(histogram.percentile(0.95), 20)
+        self.assertEqual(histogram.percentile(0.99), 20)
+        self.assertEqual(histogram.percentile(1), float('inf'))
+        self.assertEqual(histogram.as_dict()['count'], 100)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().percentile(0.5))
+
+
+class TimingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.c1 = Category.objects.create(name='Category 1')
+
+    def test_server_timing_header(self):
+        url = reverse('categories-app:category-details', args=[self.c1.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        header = response['Server-Timing']
+        for name in ('db;dur=', 'serialize;dur=', 'total;dur='):
+            self.assertIn(name, header)
+        self.assertIn('queries;desc="4"', header)
+
+    def test_histograms_per_view(self):
+        url = reverse('categories-app:category-details', args=[self.c1.pk])
+        self.client.get(url)
+        self.client.get(url)
+
+        response = self.client.get(reverse('categories-app:timing-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.data['categories-app:category-details']
+        self.assertEqual(stats['total']['count'], 2)
+        self.assertEqual(stats['queries']['sum'], 8)
+        self.assertEqual(stats['serialize']['count'], 2)
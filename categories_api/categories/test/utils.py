@@ -0,0 +1,30 @@
+from django.db import connection
+
+from categories.models import Category
+
+
+def run_on_commit_callbacks():
+    """Run callbacks that would fire when the test transaction commits."""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+def walk_kids():
+    """Brute-force closure: breadth-first walk of ``kids`` from every node."""
+    expected = set()
+    for category in Category.objects.all():
+        frontier = [category]
+        depth = 0
+        seen = set()
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                if node.pk in seen:
+                    continue
+                seen.add(node.pk)
+                expected.add((category.pk, node.pk, depth))
+                next_frontier.extend(node.kids.all())
+            frontier = next_frontier
+            depth += 1
+    return expected
@@ -0,0 +1,138 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+# Upper bounds of histogram buckets in milliseconds; the last one is open.
+BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+           float('inf'))
+
+
+class Histogram:
+    """Bucketed distribution; spans are observed in milliseconds and
+    ``queries`` as a plain count."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms):
+        for i, bound in enumerate(BUCKETS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': [[str(bound), count]
+                        for bound, count in zip(BUCKETS, self.counts)],
+        }
+
+
+class TimingRegistry:
+    """Per-view histograms of request timings for this process."""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, timings):
+        with self.lock:
+            histograms = self.views.setdefault(view, {})
+            for name, value in timings.items():
+                histograms.setdefault(name, Histogram()).observe(value)
+
+    def as_dict(self):
+        with self.lock:
+            return {view: {name: histogram.as_dict()
+                           for name, histogram in histograms.items()}
+                    for view, histograms in self.views.items()}
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+registry = TimingRegistry()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        self.spans = {'db': 0.0}
+
+    def add(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('db', (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def timed(request, name):
+    """Add the time spent in the block to the request's ``name`` span."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+class TimingMiddleware:
+    """Record query count, DB time, serialization time and total time per
+    request, send them as a Server-Timing header and aggregate them into
+    per-view histograms served by ``stats/timings/``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.timings = RequestTimings()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timings.db_wrapper))
+            response = self.get_response(request)
+        timings.add('total', (time.perf_counter() - started) * 1000)
+
+        response['Server-Timing'] = ', '.join(
+            '{};dur={:.3f}'.format(name, ms)
+            for name, ms in timings.spans.items())
+        response['Server-Timing'] += ', queries;desc="{}"'.format(
+            timings.queries)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        spans = dict(timings.spans, queries=timings.queries)
+        registry.observe(view, spans)
+        return response
@@ -0,0 +1,576 @@
+from collections import Counter, OrderedDict
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, Min, PositiveIntegerField, Value, When
+from rest_framework.serializers import CharField, ValidationError
+
+from categories.cache import invalidate_categories
+from categories.models import (
+    MAX_DEPTH,
+    NAME_MAX_LENGTH,
+    Category,
+    CategoryChange,
+    CategoryClosure,
+    normalize_name,
+)
+from categories.snapshot import mark_snapshot_stale
+
+
+BATCH_SIZE = 500
+
+NAME_FIELD = CharField(max_length=NAME_MAX_LENGTH)
+
+# Closure pairs added by a chunk of ``(parent, kid)`` edges, given as
+# VALUES rows: ``parent``'s ancestors over ``kid``'s descendants.
+LINK_CLOSURE_PAIRS = """
+    FROM (VALUES {edges}) e, {closure} a, {closure} d
+    WHERE a.descendant_id = e.column1 AND d.ancestor_id = e.column2
+    AND NOT EXISTS (
+        SELECT 1 FROM {closure} c
+        WHERE c.ancestor_id = a.ancestor_id
+        AND c.descendant_id = d.descendant_id)
+"""
+
+LINK_CLOSURE_SQL = """
+    INSERT INTO {closure} (ancestor_id, descendant_id, depth)
+    SELECT a.ancestor_id, d.descendant_id, MIN(a.depth + d.depth + 1)
+""" + LINK_CLOSURE_PAIRS + """
+    GROUP BY a.ancestor_id, d.descendant_id
+"""
+
+LINK_CLOSURE_COUNT_SQL = """
+    SELECT a.ancestor_id, COUNT(DISTINCT d.descendant_id)
+""" + LINK_CLOSURE_PAIRS + """
+    GROUP BY a.ancestor_id
+"""
+
+# Any edge whose kid is already an ancestor of its parent.
+LINK_CYCLE_SQL = """
+    SELECT 1 FROM (VALUES {edges}) e, {closure} c
+    WHERE c.ancestor_id = e.column2 AND c.descendant_id = e.column1
+    LIMIT 1
+"""
+
+
+def create_tree(root, batch_size=BATCH_SIZE):
+    """Insert nested ``{'name': ..., 'children': [...]}`` payload in bulk.
+
+    Nodes are inserted in pre-order, so primary keys are assigned in the
+    same order the recursive implementation used to produce.
+    """
+    names, edges = validate_tree(root, batch_size)
+    try:
+        with transaction.atomic():
+            ids = insert_categories(names, edges, batch_size)
+            insert_kids(edges, ids, batch_size)
+            insert_closure(edges, ids, batch_size)
+            record_changes(zip(ids, names),
+                           [(ids[parent], ids[kid]) for parent, kid in edges],
+                           batch_size)
+            # A new tree hangs off a new root, so only the created ids can
+            # be affected (e.g. cached before a rolled back transaction).
+            transaction.on_commit(lambda: categories_changed(ids))
+    except IntegrityError:
+        # A name was taken by another request after validation.
+        raise ValidationError(
+            {'name': 'category with this Category name already exists.'})
+    return Category(pk=ids[0], name=names[0])
+
+
+def validate_tree(root, batch_size=BATCH_SIZE):
+    """Check the whole payload before anything is written and return
+    ``(names, edges)`` as ``flatten_tree`` does.
+
+    Malformed nodes, names used more than once and names that already
+    exist (looked up with chunked ``name__in`` queries) are all reported in
+    one ValidationError.
+    """
+    names, edges, errors = flatten_tree(root)
+    valid = [name for name in names if name is not None]
+    for name in sorted(fetch_id_map(valid, batch_size)):
+        errors.setdefault('name', []).append(
+            'Category "{}" already exists.'.format(name))
+    if errors:
+        raise ValidationError(errors)
+    return names, edges
+
+
+def merge_nodes(records, batch_size=BATCH_SIZE):
+    """Get-or-create ``(name, parent_name)`` records in one transaction.
+
+    Unknown names are created with bulk inserts and every parent link that
+    doesn't exist yet is added. ``parent_name`` may be None, the name of
+    another record or of an existing category. Returns ``(ids, created)``:
+    a ``{name: pk}`` map for every name involved and the set of new pks.
+    """
+    records = list(records)
+    names = list(OrderedDict.fromkeys(name for name, _ in records))
+    parents = set(parent for _, parent in records if parent is not None)
+    with transaction.atomic():
+        ids = fetch_id_map(names + list(parents - set(names)), batch_size)
+        unknown = sorted(parents - set(names) - set(ids))
+        if unknown:
+            raise ValidationError(
+                {'parent': 'Unknown parent categories: {}.'.format(
+                    ', '.join(unknown))})
+        new_names = [name for name in names if name not in ids]
+        Category.objects.bulk_create(
+            [new_category(name) for name in new_names], batch_size=batch_size)
+        ids.update(fetch_id_map(new_names, batch_size))
+        created = set(ids[name] for name in new_names)
+
+        edges = list(OrderedDict.fromkeys(
+            (ids[parent], ids[name]) for name, parent in records
+            if parent is not None))
+        edges = drop_existing_kids(edges, created, batch_size)
+        if any(parent == kid for parent, kid in edges):
+            raise ValidationError({'parent': 'A category can\'t be its own '
+                                             'parent.'})
+        Kids = Category.kids.through
+        bulk_insert(Kids, (Kids(from_category_id=parent, to_category_id=kid)
+                           for parent, kid in edges), batch_size)
+
+        # New categories take their closure rows from their first parent;
+        # further parents of new categories and new parents of existing
+        # ones are linked afterwards, all edges at once.
+        first_parent = {}
+        linked = []
+        for parent, kid in edges:
+            if kid in created and kid not in first_parent:
+                first_parent[kid] = parent
+            else:
+                linked.append((parent, kid))
+        rows = list(new_closure_rows([ids[name] for name in new_names],
+                                     first_parent, batch_size))
+        bulk_insert(CategoryClosure, rows, batch_size)
+        descendants = Counter(row.ancestor_id for row in rows if row.depth)
+        descendants.update(link_closure(linked, batch_size))
+        record_changes(((ids[name], name) for name in new_names), edges,
+                       batch_size)
+
+        moved = fetch_closure(set(kid for _, kid in edges) - created,
+                              'ancestor_id', 'descendant_id', batch_size)
+        children = Counter(parent for parent, _ in edges)
+        update_counts(children, descendants, batch_size)
+        update_depths(created | moved, batch_size)
+        # Ancestors' detail payloads change through descendants_count.
+        touch_categories(
+            (affected_by_edges(edges, created, batch_size) |
+             set(descendants)) - created, batch_size)
+        transaction.on_commit(lambda: categories_changed(created))
+    return ids, created
+
+
+def fetch_id_map(names, batch_size=BATCH_SIZE):
+    by_name = {}
+    for chunk in chunks(names, batch_size):
+        by_name.update(Category.objects.filter(name__in=chunk)
+                       .values_list('name', 'id'))
+    return by_name
+
+
+def drop_existing_kids(edges, created, batch_size=BATCH_SIZE):
+    # Only categories that existed before can already have the link.
+    kids = list(set(kid for _, kid in edges if kid not in created))
+    existing = set()
+    Kids = Category.kids.through
+    for chunk in chunks(kids, batch_size):
+        existing.update(Kids.objects.filter(to_category_id__in=chunk)
+                        .values_list('from_category_id', 'to_category_id'))
+    return [edge for edge in edges if edge not in existing]
+
+
+def new_closure_rows(pks, first_parent, batch_size=BATCH_SIZE):
+    """Yield closure rows for new categories ``pks``, each hung under
+    ``first_parent[pk]`` (a new or an existing category) or a root."""
+    ancestors = {}
+    existing = list(set(first_parent.values()) - set(pks))
+    for chunk in chunks(existing, batch_size):
+        for descendant, ancestor, depth in (
+                CategoryClosure.objects.filter(descendant_id__in=chunk)
+                .values_list('descendant_id', 'ancestor_id', 'depth')):
+            ancestors.setdefault(descendant, []).append((ancestor, depth))
+    for pk in existing:
+        # Categories created outside the serializer have no closure rows.
+        ancestors.setdefault(pk, [(pk, 0)])
+
+    for pk in pks:
+        path = []
+        on_path = set()
+        node = pk
+        while node is not None and node not in ancestors:
+            if node in on_path:
+                raise ValidationError(
+                    {'parent': 'Parent links must not form a cycle.'})
+            path.append(node)
+            on_path.add(node)
+            node = first_parent.get(node)
+        lineage = ancestors[node] if node is not None else []
+        for node in reversed(path):
+            lineage = [(node, 0)] + [(ancestor, depth + 1)
+                                     for ancestor, depth in lineage]
+            ancestors[node] = lineage
+        for ancestor, depth in ancestors[pk]:
+            yield CategoryClosure(ancestor_id=ancestor, descendant_id=pk,
+                                  depth=depth)
+
+
+def link_closure(edges, batch_size=BATCH_SIZE):
+    """Add closure rows for each ``(parent, kid)`` edge's subtree under the
+    parent's ancestors and return ``{ancestor: new descendants}``.
+
+    Every round is one INSERT ... SELECT per chunk of edges and is repeated
+    until it adds nothing; each round doubles the length of the chains of
+    new edges it has followed.
+    Where a pair is already reachable through another path its existing
+    depth is kept.
+    """
+    descendants = Counter()
+    if not edges:
+        return descendants
+    add_self_rows(set(pk for edge in edges for pk in edge), batch_size)
+    closure = CategoryClosure._meta.db_table
+    # Two parameters per edge.
+    size = max(1, batch_size // 2)
+    with connection.cursor() as cursor:
+        while True:
+            added = Counter()
+            for chunk in chunks(edges, size):
+                values = ', '.join(['(%s, %s)'] * len(chunk))
+                params = [pk for edge in chunk for pk in edge]
+                cursor.execute(LINK_CYCLE_SQL.format(
+                    edges=values, closure=closure), params)
+                if cursor.fetchone() is not None:
+                    raise ValidationError(
+                        {'parent': 'Parent links must not form a cycle.'})
+                cursor.execute(LINK_CLOSURE_COUNT_SQL.format(
+                    edges=values, closure=closure), params)
+                counts = dict(cursor.fetchall())
+                if counts:
+                    cursor.execute(LINK_CLOSURE_SQL.format(
+                        edges=values, closure=closure), params)
+                    added.update(counts)
+            if not added:
+                return descendants
+            descendants.update(added)
+
+
+def add_self_rows(pks, batch_size=BATCH_SIZE):
+    # Categories created outside the serializer have no closure rows.
+    found = set()
+    for chunk in chunks(list(pks), batch_size):
+        found.update(CategoryClosure.objects
+                     .filter(descendant_id__in=chunk,
+                             ancestor_id=F('descendant_id'))
+                     .values_list('descendant_id', flat=True))
+    bulk_insert(CategoryClosure,
+                (CategoryClosure(ancestor_id=pk, descendant_id=pk, depth=0)
+                 for pk in sorted(set(pks) - found)), batch_size)
+
+
+def fetch_closure(pks, field, other, batch_size=BATCH_SIZE):
+    """Return ``other`` ids of closure rows whose ``field`` is in ``pks``,
+    e.g. ancestors of ``pks`` for ``('descendant_id', 'ancestor_id')``."""
+    found = set()
+    for chunk in chunks(list(pks), batch_size):
+        found.update(CategoryClosure.objects
+                     .filter(**{field + '__in': chunk})
+                     .values_list(other, flat=True))
+    return found
+
+
+def update_counts(children, descendants, batch_size=BATCH_SIZE):
+    """Add ``{pk: n}`` new kids to ``children_count`` and new closure rows
+    to ``descendants_count``."""
+    update_values('children_count', children, batch_size, add=True)
+    update_values('descendants_count', descendants, batch_size, add=True)
+
+
+def update_values(field, values, batch_size=BATCH_SIZE, add=False):
+    """Set categories' ``field`` to ``values[pk]``, or add to it with
+    ``add``, with one CASE UPDATE per chunk of ids."""
+    # Three parameters per id: two in the CASE and one in the IN list.
+    for chunk in chunks(sorted(values.items()), max(1, batch_size // 3)):
+        value = Case(*[When(pk=pk, then=Value(n)) for pk, n in chunk],
+                     output_field=PositiveIntegerField())
+        Category.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+            **{field: F(field) + value if add else value})
+
+
+def update_depths(pks, batch_size=BATCH_SIZE):
+    """Recompute ``depth`` of ``pks`` from their lowest-id parents.
+
+    ``pks`` must include everything under a category whose depth changes.
+    """
+    pks = list(pks)
+    Kids = Category.kids.through
+    min_parent = {}
+    for chunk in chunks(pks, batch_size):
+        min_parent.update(Kids.objects.filter(to_category_id__in=chunk)
+                          .order_by().values('to_category_id')
+                          .annotate(parent=Min('from_category_id'))
+                          .values_list('to_category_id', 'parent'))
+    known = {}
+    for chunk in chunks(list(set(min_parent.values()) - set(pks)),
+                        batch_size):
+        known.update(Category.objects.filter(pk__in=chunk)
+                     .values_list('pk', 'depth'))
+    depths = resolve_depths(pks, min_parent, known)
+    update_values('depth', {pk: depths[pk] for pk in pks}, batch_size)
+
+
+def resolve_depths(pks, min_parent, known):
+    """Return ``{pk: depth}`` following ``min_parent`` links up to a root
+    or to a category in ``known``."""
+    depths = dict(known)
+    for pk in pks:
+        path = []
+        node = pk
+        while node not in depths:
+            parent = min_parent.get(node)
+            if parent is None or len(path) >= MAX_DEPTH:
+                depths[node] = 0
+                break
+            path.append(node)
+            node = parent
+        depth = depths[node]
+        for node in reversed(path):
+            depth += 1
+            depths[node] = depth
+    return depths
+
+
+def compute_hierarchy(pks, edges, descendant_counts):
+    """Return ``{pk: (depth, children_count, descendants_count)}`` for the
+    whole graph given as ``pks`` and ``(parent, kid)`` ``edges``.
+
+    ``descendant_counts`` maps categories to their closure rows below
+    themselves; a DAG's descendant sets can't be summed from kids.
+    """
+    children = Counter(parent for parent, _ in edges)
+    min_parent = {}
+    for parent, kid in edges:
+        if parent < min_parent.get(kid, parent + 1):
+            min_parent[kid] = parent
+    depths = resolve_depths(pks, min_parent, {})
+    return {pk: (depths[pk], children[pk], descendant_counts.get(pk, 0))
+            for pk in pks}
+
+
+def update_grouped(queryset, field, values, batch_size=BATCH_SIZE):
+    """Set ``field`` to ``values[pk]`` with one UPDATE per distinct value
+    and chunk of ids."""
+    by_value = {}
+    for pk, value in values.items():
+        by_value.setdefault(value, []).append(pk)
+    for value, pks in by_value.items():
+        for chunk in chunks(pks, batch_size):
+            queryset.filter(pk__in=chunk).update(**{field: value})
+
+
+def affected_by_edges(edges, created, batch_size=BATCH_SIZE):
+    """Return existing categories whose detail payload changes when
+    ``edges`` are added: parents gain children, their other kids gain
+    siblings and re-linked kids gain parents for their whole subtree."""
+    parents = list(set(parent for parent, _ in edges) - created)
+    kids = list(set(kid for _, kid in edges) - created)
+    affected = set(parents)
+    Kids = Category.kids.through
+    for chunk in chunks(parents, batch_size):
+        affected.update(Kids.objects.filter(from_category_id__in=chunk)
+                        .values_list('to_category_id', flat=True))
+    for chunk in chunks(kids, batch_size):
+        affected.update(CategoryClosure.objects.filter(ancestor_id__in=chunk)
+                        .values_list('descendant_id', flat=True))
+    return affected - created
+
+
+def flatten_tree(root):
+    """Walk payload iteratively and return pre-ordered names and edges.
+
+    ``edges`` is a list of ``(parent_index, kid_index)`` pairs pointing into
+    ``names``. Problems don't stop the walk; they are returned as a
+    ``{field: [message, ...]}`` dict, empty when the payload is valid.
+    """
+    names = []
+    edges = []
+    errors = {}
+    seen = set()
+    duplicates = set()
+    stack = [(root, None)]
+    while stack:
+        node, parent = stack.pop()
+        try:
+            name = validate_node(node)
+        except ValidationError as error:
+            for field, message in error.detail.items():
+                errors.setdefault(field, []).append(message)
+            if not isinstance(node, dict):
+                continue
+            # Only "children" may be wrong; the name is still checked.
+            name = (None if 'name' in error.detail
+                    else validate_node({'name': node['name']}))
+        if name in seen and name not in duplicates:
+            duplicates.add(name)
+            errors.setdefault('name', []).append(
+                '"{}" is used more than once.'.format(name))
+        elif name is not None:
+            seen.add(name)
+        index = len(names)
+        names.append(name)
+        if parent is not None:
+            edges.append((parent, index))
+        children = node.get('children')
+        if isinstance(children, list):
+            for child in reversed(children):
+                stack.append((child, index))
+    return names, edges, errors
+
+
+def iter_tree_records(trees):
+    """Yield ``(name, parent_name)`` for every node of every tree, parents
+    first."""
+    for tree in trees:
+        stack = [(tree, None)]
+        while stack:
+            node, parent = stack.pop()
+            name = validate_node(node)
+            yield name, parent
+            for child in reversed(node.get('children') or []):
+                stack.append((child, name))
+
+
+def validate_node(node):
+    if not isinstance(node, dict):
+        raise ValidationError({'children': 'Each child must be an object.'})
+    name = node.get('name')
+    if name is None:
+        raise ValidationError({'name': '"name" field is required.'})
+    try:
+        # Same rules as the serializer's field for the root: numbers are
+        # converted, whitespace is trimmed and blank names are rejected.
+        name = NAME_FIELD.run_validation(name)
+    except ValidationError as error:
+        raise ValidationError({'name': error.detail[0]})
+    validate_children(node.get('children'))
+    return name
+
+
+def validate_children(children):
+    if not isinstance(children or [], list):
+        raise ValidationError({'children': '"children" must be a list.'})
+
+
+def insert_categories(names, edges, batch_size=BATCH_SIZE):
+    Category.objects.bulk_create(
+        [new_category(name, depth=depth, children_count=kids,
+                      descendants_count=descendants)
+         for name, (depth, kids, descendants)
+         in zip(names, tree_hierarchy(len(names), edges))],
+        batch_size=batch_size)
+    return fetch_ids(names, batch_size)
+
+
+def tree_hierarchy(size, edges):
+    """Return ``(depth, children_count, descendants_count)`` per node of a
+    new tree from its pre-ordered ``flatten_tree`` edges."""
+    depths = [0] * size
+    kids = [0] * size
+    descendants = [0] * size
+    for parent, kid in edges:
+        depths[kid] = depths[parent] + 1
+        kids[parent] += 1
+    # A kid's subtree follows it in pre-order, so walking backwards
+    # completes every subtree before it is added to its parent.
+    for parent, kid in reversed(edges):
+        descendants[parent] += descendants[kid] + 1
+    return zip(depths, kids, descendants)
+
+
+def new_category(name, **fields):
+    return Category(name=name, normalized_name=normalize_name(name),
+                    **fields)
+
+
+def fetch_ids(names, batch_size=BATCH_SIZE):
+    # bulk_create() sets primary keys on PostgreSQL only, so look them up by
+    # the unique name instead.
+    by_name = fetch_id_map(names, batch_size)
+    return [by_name[name] for name in names]
+
+
+def insert_kids(edges, ids, batch_size=BATCH_SIZE):
+    Kids = Category.kids.through
+    Kids.objects.bulk_create(
+        [Kids(from_category_id=ids[parent], to_category_id=ids[kid])
+         for parent, kid in edges],
+        batch_size=batch_size)
+
+
+def insert_closure(edges, ids, batch_size=BATCH_SIZE):
+    rows = (CategoryClosure(ancestor_id=ids[ancestor],
+                            descendant_id=ids[descendant], depth=depth)
+            for ancestor, descendant, depth in closure_paths(edges))
+    bulk_insert(CategoryClosure, rows, batch_size)
+
+
+def closure_paths(edges):
+    """Yield ``(ancestor, descendant, depth)`` index triples for a tree.
+
+    ``edges`` must be in pre-order as produced by ``flatten_tree``, which
+    lets us keep only the current root-to-node path in memory.
+    """
+    path = [0]
+    yield 0, 0, 0
+    for parent, kid in edges:
+        while path[-1] != parent:
+            path.pop()
+        path.append(kid)
+        for depth, ancestor in enumerate(reversed(path)):
+            yield ancestor, kid, depth
+
+
+def bulk_insert(model, objs, batch_size=BATCH_SIZE):
+    objs = iter(objs)
+    batch = list(islice(objs, batch_size))
+    while batch:
+        model.objects.bulk_create(batch)
+        batch = list(islice(objs, batch_size))
+
+
+def record_changes(created, edges, batch_size=BATCH_SIZE, updated=()):
+    """Append ``(pk, name)`` creations, ``(parent, kid)`` links and then
+    ``updated`` pks to the change log, in the caller's transaction so they
+    commit together with the write."""
+    changes = [CategoryChange(kind=CategoryChange.CREATED, category=pk,
+                              name=name) for pk, name in created]
+    changes.extend(CategoryChange(kind=CategoryChange.LINKED, category=kid,
+                                  parent=parent) for parent, kid in edges)
+    changes.extend(CategoryChange(kind=CategoryChange.UPDATED, category=pk)
+                   for pk in updated)
+    bulk_insert(CategoryChange, changes, batch_size)
+
+
+def touch_categories(pks, batch_size=BATCH_SIZE):
+    """Bump ``version`` of existing categories whose children, siblings,
+    ancestor chain or counters changed, and drop their cached details on
+    commit."""
+    pks = list(pks)
+    if not pks:
+        return
+    for chunk in chunks(pks, batch_size):
+        Category.objects.filter(pk__in=chunk).update(version=F('version') + 1)
+    transaction.on_commit(lambda: categories_changed(pks))
+
+
+def categories_changed(pks):
+    """Drop cached details of ``pks`` and have the in-memory snapshot pick
+    up the new rows on its next read."""
+    invalidate_categories(pks)
+    mark_snapshot_stale()
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -1,8 +1,15 @@
 from django.urls import path
 
 from categories.views import (
+    CacheStatsView,
+    CategoryBatchView,
+    CategoryChangesView,
     CategoryCreateView,
     CategoryRetrieveView,
+    CategorySearchView,
+    CategoryDescendantsView,
+    CategorySubtreeExportView,
+    TimingStatsView,
 )
 
 
@@ -10,5 +17,17 @@ app_name = 'categories-app'
 
 urlpatterns = [
     path('categories/', CategoryCreateView.as_view(), name='category-create'),
+    path('categories/batch/', CategoryBatchView.as_view(),
+         name='category-batch'),
+    path('categories/changes/', CategoryChangesView.as_view(),
+         name='category-changes'),
+    path('categories/search/', CategorySearchView.as_view(),
+         name='category-search'),
     path('categories/<int:pk>/', CategoryRetrieveView.as_view(), name='category-details'),
+    path('categories/<int:pk>/descendants/', CategoryDescendantsView.as_view(),
+         name='category-descendants'),
+    path('categories/<int:pk>/subtree/', CategorySubtreeExportView.as_view(),
+         name='category-subtree'),
+    path('stats/cache/', CacheStatsView.as_view(), name='cache-stats'),
+    path('stats/timings/', TimingStatsView.as_view(), name='timing-stats'),
 ]
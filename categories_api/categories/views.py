@@ -1,13 +1,80 @@
+import json
+import sys
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from itertools import chain, islice
+
 from rest_framework.generics import CreateAPIView, RetrieveAPIView
-from rest_framework.exceptions import ParseError
+from rest_framework.views import APIView
+from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db import IntegrityError, connections, router
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import Http404, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import parse_etags, quote_etag
 
 from categories.serializers import (
+    CategoryBatchCreateSerializer,
+    CategoryChangesSerializer,
     CategoryCreateSerializer,
-    CategoryRetrieveSerializer
+    CategoryRetrieveSerializer,
+    CategorySerializer,
+    CategorySubtreeSerializer,
+    CategoryTreeRetrieveSerializer,
+)
+from categories.cache import get_category_cache
+from categories.models import (
+    HIERARCHY_FIELDS,
+    MAX_DEPTH,
+    Category,
+    CategoryChange,
+    CategoryClosure,
+    normalize_name,
+    settled_cursor,
 )
-from categories.models import Category
+from categories.renderers import FastJSONRenderer, NDJSONRenderer
+from categories.snapshot import get_snapshot
+from categories.tree import (
+    BATCH_SIZE,
+    chunks,
+    iter_tree_records,
+    merge_nodes,
+)
+from categories.timing import registry as timing_registry, timed
+
+
+EXPANSION_DEFAULTS = {
+    'MAX_DEPTH': 5,
+    # Upper bound on categories in one expanded tree.
+    'MAX_NODES': 1000,
+}
+
+PAGINATION_DEFAULTS = {
+    # Paginate every detail response, not only those asking for it.
+    'ENABLED': False,
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+}
+
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors (origin, id, depth) AS (
+        SELECT to_category_id, MIN(from_category_id), 1 FROM {kids}
+        WHERE to_category_id IN ({origins})
+        GROUP BY to_category_id
+        UNION ALL
+        SELECT a.origin, (SELECT MIN(k.from_category_id) FROM {kids} k
+                          WHERE k.to_category_id = a.id), a.depth + 1
+        FROM ancestors a
+        WHERE a.id IS NOT NULL AND a.depth < %s
+    )
+    SELECT a.origin, c.id, c.name FROM ancestors a
+    JOIN {category} c ON c.id = a.id
+    ORDER BY a.origin, a.depth
+"""
 
 
 class CategoryCreateView(CreateAPIView):
@@ -15,18 +82,409 @@ class CategoryCreateView(CreateAPIView):
 
 
 class CategoryRetrieveView(RetrieveAPIView):
+    renderer_classes = (FastJSONRenderer,)
 
     def retrieve(self, request, *args, **kwargs):
         pk = fetch_pk(self.kwargs)
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        paging = fetch_paging(request.query_params)
+        expansion = fetch_expansion(request.query_params)
+        # Cache and snapshot hold whole payloads; pages and expanded trees
+        # come from the database.
+        whole = paging is None and expansion is None
+        cache = get_category_cache() if whole else None
+        if cache is not None:
+            cached = cache.get(pk)
+            if cached is not None:
+                etag, data = cached
+                return conditional_response(etag, etags, data)
+
+        snapshot = get_snapshot() if whole else None
+        found = snapshot.detail(pk) if snapshot is not None else None
+        if found is not None:
+            version, data = found
+            data = serialize(request, CategoryRetrieveSerializer, data)
+            return conditional_response(make_etag(pk, version), etags, data)
+
+        if etags and expansion is None:
+            # Answer conditional requests from the version column alone,
+            # before any related rows are loaded.
+            version = (Category.objects.filter(pk=pk)
+                       .values_list('version', flat=True).first())
+            if version is None:
+                raise Http404
+            etag = make_etag(pk, version)
+            if matches(etag, etags):
+                return not_modified(etag)
+
         obj = get_object_or_404(Category, pk=pk)
         data = {'id': obj.pk, 'name': obj.name}
         data['children'] = obj.kids.all()
         data['parents'] = fetch_parents(obj) # Based on task assume that only
                                              # one direct parent.
         data['siblings'] = obj.siblings.all()
-        serializer = CategoryRetrieveSerializer(data)
+        for field in HIERARCHY_FIELDS:
+            data[field] = getattr(obj, field)
+        fields = ('children', 'siblings')
+        serializer_class = CategoryRetrieveSerializer
+        truncated = False
+        if expansion is not None:
+            data['children'], truncated = expand_children(obj.pk, *expansion)
+            fields = ('siblings',)
+            serializer_class = CategoryTreeRetrieveSerializer
+        if paging is not None:
+            size, cursors = paging
+            parents = {'children': [obj.pk],
+                       'siblings': fetch_parent_ids(obj.pk)}
+            for field in fields:
+                data[field], data[field + '_next'] = fetch_page(
+                    request, parents[field], field + '_cursor', size,
+                    cursors[field], obj.pk)
+        elif fast_json_enabled():
+            for field in fields:
+                data[field] = to_nodes(data[field])
+        if truncated:
+            data['truncated'] = True
+        data = serialize(request, serializer_class, data)
+        if expansion is not None:
+            # Changes deeper down don't bump this category's version, so
+            # expanded trees get no ETag.
+            return Response(data=data)
+        etag = make_etag(obj.pk, obj.version)
+
+        if cache is not None:
+            cache.set(pk, (etag, dict(data)))
+        return conditional_response(etag, [], data)
+
+
+class CategoryBatchView(APIView):
+    renderer_classes = (FastJSONRenderer,)
+    max_ids = 100
+    max_nodes = 10000
+
+    def post(self, request, *args, **kwargs):
+        """Get-or-create a list of nested trees in one transaction.
+
+        Names that already exist are reused and linked under their new
+        parents instead of being rejected.
+        """
+        records = fetch_tree_records(request.data, self.max_nodes)
+        try:
+            ids, created = merge_nodes(records)
+        except IntegrityError:
+            # Another request created one of the names first.
+            raise ValidationError({'name': 'Categories changed while the '
+                                           'batch was written, retry it.'})
+        roots = OrderedDict.fromkeys(name for name, parent in records
+                                     if parent is None)
+        data = {
+            'created': len(created),
+            'roots': [{'id': ids[name], 'name': name,
+                       'created': ids[name] in created} for name in roots],
+        }
+        data = serialize(request, CategoryBatchCreateSerializer, data)
+
+        return Response(data=data, status=status.HTTP_201_CREATED if created
+                        else status.HTTP_200_OK)
+
+    def get(self, request, *args, **kwargs):
+        pks = fetch_pks(request.query_params, self.max_ids)
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            details = fetch_snapshot_details(snapshot, pks)
+        else:
+            details = fetch_details(pks)
+        data = serialize(request, CategoryRetrieveSerializer, details,
+                         many=True)
+
+        return Response(data=data)
+
+
+class CategorySearchView(APIView):
+    renderer_classes = (FastJSONRenderer,)
+    default_limit = 10
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        raw_query = request.query_params.get('q', '')
+        query = normalize_name(raw_query)
+        if not query:
+            raise ParseError('"q" is required.')
+        if raw_query[-1].isspace():
+            # "book " should only match names with a word after "book".
+            query += ' '
+        limit = fetch_limit(request.query_params, self.default_limit,
+                            self.max_limit)
+        data = serialize(request, CategorySerializer,
+                         list(search_prefix(query, limit)), many=True)
+
+        return Response(data=data)
+
+
+class CategoryChangesView(APIView):
+    """Changes logged after the ``since`` cursor, oldest first.
+
+    ``cursor`` is always returned, so consumers can keep polling with it
+    once ``next`` is null. It stays behind changes logged within the last
+    SETTLE_SECONDS (see ``models.settled_cursor``), so those are served
+    again together with any that committed late; consumers dedupe by id.
+    """
+    default_limit = 100
+    max_limit = 1000
+
+    def get(self, request, *args, **kwargs):
+        since = decode_cursor(request.query_params.get('since'))
+        limit = fetch_limit(request.query_params, self.default_limit,
+                            self.max_limit)
+        changes = list(CategoryChange.objects.filter(pk__gt=since)
+                       .order_by('pk')
+                       .values('id', 'kind', 'category', 'parent', 'name',
+                               'created_at')[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+        cursor = settled_cursor(
+            since, [(c['id'], c['created_at']) for c in changes])
+        url = None
+        # Paging on from unsettled changes could skip a late commit, so
+        # the rest waits until they settle.
+        if more and cursor == changes[-1]['id']:
+            url = replace_query_param(request.build_absolute_uri(), 'since',
+                                      encode_cursor(cursor))
+        data = serialize(request, CategoryChangesSerializer, {
+            'results': changes,
+            'cursor': encode_cursor(cursor),
+            'next': url,
+        })
+
+        return Response(data=data)
+
+
+class CacheStatsView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        cache = get_category_cache()
+        return Response(data={
+            'enabled': cache is not None,
+            'stats': cache.stats() if cache is not None else {},
+        })
+
+
+class CategoryDescendantsView(RetrieveAPIView):
+    renderer_classes = (FastJSONRenderer,)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = fetch_pk(self.kwargs)
+        snapshot = get_snapshot()
+        rows = snapshot.subtree(pk) if snapshot is not None else None
+        if rows is None:
+            rows = list(fetch_subtree(pk))
+        if not rows:
+            # Categories created outside CategoryCreateSerializer have no
+            # closure rows; they are reported without descendants.
+            obj = get_object_or_404(Category, pk=pk)
+            rows = [(obj.pk, obj.name, None, 0)]
+        root, descendants = rows[0], rows[1:]
+        data = {'id': root[0], 'name': root[1]}
+        data['descendants'] = [
+            {'id': id, 'name': name, 'parent': parent, 'depth': depth}
+            for id, name, parent, depth in descendants
+        ]
+        data = serialize(request, CategorySubtreeSerializer, data)
+
+        return Response(data=data)
+
+
+class CategorySubtreeExportView(APIView):
+    renderer_classes = (NDJSONRenderer,)
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        pk = fetch_pk(self.kwargs)
+        rows = fetch_subtree(pk).iterator(chunk_size=self.chunk_size)
+        first = next(rows, None)
+        if first is None:
+            obj = get_object_or_404(Category, pk=pk)
+            first = (obj.pk, obj.name, None, 0)
+        # Root is reported without its own parent, as in the descendants
+        # endpoint.
+        first = first[:2] + (None, 0)
+        return StreamingHttpResponse(
+            stream_ndjson(chain([first], rows), self.chunk_size),
+            content_type=NDJSONRenderer.media_type)
+
+
+def stream_ndjson(rows, chunk_size):
+    """Encode ``(id, name, parent, depth)`` rows as NDJSON, yielding one
+    bytes chunk per ``chunk_size`` rows."""
+    while True:
+        lines = [
+            json.dumps({'id': id, 'name': name, 'parent': parent,
+                        'depth': depth},
+                       ensure_ascii=False, separators=(',', ':'))
+            for id, name, parent, depth in islice(rows, chunk_size)
+        ]
+        if not lines:
+            return
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+
+
+class TimingStatsView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=timing_registry.as_dict())
+
+
+def fast_json_enabled():
+    return getattr(settings, 'CATEGORIES_FAST_JSON', False)
+
+
+def serialize(request, serializer_class, data, many=False):
+    """Run ``data`` through ``serializer_class``.
+
+    With CATEGORIES_FAST_JSON the views already build plain dicts with the
+    serializer's keys, order and types, so they are returned as they are
+    and left to ``FastJSONRenderer``.
+    """
+    if fast_json_enabled():
+        return data
+    serializer = serializer_class(data, many=many)
+    with timed(request, 'serialize'):
+        return serializer.data
+
 
-        return Response(data=serializer.data)
+def to_nodes(categories):
+    return [{'id': id, 'name': name}
+            for id, name in categories.values_list('id', 'name')]
+
+
+def make_etag(pk, version):
+    return quote_etag('{}.{}'.format(pk, version))
+
+
+def matches(etag, etags):
+    return etag in etags or '*' in etags
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def conditional_response(etag, etags, data):
+    if matches(etag, etags):
+        return not_modified(etag)
+    response = Response(data=data)
+    response['ETag'] = etag
+    return response
+
+
+def fetch_paging(query_params):
+    """Return ``(page_size, {'children': after, 'siblings': after})`` when
+    the children and siblings lists should be paginated, otherwise None.
+
+    Pagination is on when CATEGORIES_PAGINATION['ENABLED'] is set or the
+    request passes ``page_size`` or one of the cursors.
+    """
+    options = dict(PAGINATION_DEFAULTS,
+                   **getattr(settings, 'CATEGORIES_PAGINATION', {}))
+    params = ('page_size', 'children_cursor', 'siblings_cursor')
+    if not options['ENABLED'] and not any(p in query_params for p in params):
+        return None
+    size = fetch_limit(query_params, options['PAGE_SIZE'],
+                       options['MAX_PAGE_SIZE'], param='page_size')
+    cursors = {field: decode_cursor(query_params.get(field + '_cursor'))
+               for field in ('children', 'siblings')}
+    return size, cursors
+
+
+def fetch_expansion(query_params):
+    """Return ``(depth, max_nodes)`` for ``?depth=N``, otherwise None."""
+    if 'depth' not in query_params:
+        return None
+    options = dict(EXPANSION_DEFAULTS,
+                   **getattr(settings, 'CATEGORIES_EXPANSION', {}))
+    depth = fetch_limit(query_params, 1, options['MAX_DEPTH'], param='depth')
+    return depth, options['MAX_NODES']
+
+
+def expand_children(pk, depth, max_nodes):
+    """Return the kids of ``pk`` nested ``depth`` levels deep and whether
+    ``max_nodes`` cut the tree short.
+
+    Runs one query per level for the whole frontier (chunked to stay under
+    SQLite's variable limit). Nodes on the last level have no ``children``
+    key. A category reachable through several parents appears under each.
+    """
+    Kids = Category.kids.through
+    roots = []
+    level = {pk: {'children': roots}}
+    left = max_nodes
+    for current in range(1, depth + 1):
+        rows = []
+        for chunk in chunks(sorted(level), BATCH_SIZE):
+            rows.extend(Kids.objects.filter(from_category_id__in=chunk)
+                        .order_by('from_category_id', 'to_category_id')
+                        .values_list('from_category_id', 'to_category_id',
+                                     'to_category__name')[:left + 1])
+        truncated = len(rows) > left
+        rows = rows[:left]
+        left -= len(rows)
+        next_level = {}
+        for parent, kid, name in rows:
+            node = next_level.get(kid)
+            if node is None:
+                node = next_level[kid] = {'id': kid, 'name': name}
+                if current < depth:
+                    node['children'] = []
+            level[parent]['children'].append(node)
+        if truncated or not next_level:
+            return roots, truncated
+        level = next_level
+    return roots, False
+
+
+def fetch_page(request, parents, cursor_param, size, after, exclude):
+    """Keyset page of the kids of ``parents`` (other than ``exclude``)
+    after id ``after``, in id order, and the URL of the next page or None.
+
+    Every parent's page walks the kids table's ``(from, to)`` index in
+    order and the pages are merged, so no query sorts all kids.
+    """
+    rows = {}
+    for parent in parents:
+        for kid, name in kid_page(parent, after, exclude)[:size + 1]:
+            rows[kid] = name
+    ids = sorted(rows)[:size + 1]
+    page = [{'id': pk, 'name': rows[pk]} for pk in ids[:size]]
+    if len(ids) <= size:
+        return page, None
+    url = replace_query_param(request.build_absolute_uri(), cursor_param,
+                              encode_cursor(ids[size - 1]))
+    return page, url
+
+
+def kid_page(parent, after, exclude):
+    Kids = Category.kids.through
+    return (Kids.objects
+            .filter(from_category_id=parent, to_category_id__gt=after)
+            .exclude(to_category_id=exclude)
+            .order_by('to_category_id')
+            .values_list('to_category_id', 'to_category__name'))
+
+
+def encode_cursor(pk):
+    return urlsafe_b64encode(str(pk).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    if cursor is None:
+        return 0
+    try:
+        return int(urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ParseError('Invalid cursor.')
 
 
 def fetch_pk(kwargs):
@@ -35,8 +493,150 @@ def fetch_pk(kwargs):
     except AttributeError:
         raise ParseError()
 
+
+def fetch_limit(query_params, default, maximum, param='limit'):
+    try:
+        limit = int(query_params.get(param, default))
+    except ValueError:
+        raise ParseError('"{}" must be an integer.'.format(param))
+    if not 1 <= limit <= maximum:
+        raise ParseError('"{}" must be between 1 and {}.'.format(param,
+                                                                 maximum))
+    return limit
+
+
+def search_prefix(query, limit):
+    """Categories whose normalized name starts with ``query``, in name
+    order.
+
+    The range bounds let SQLite walk the normalized_name index; the LIKE
+    filter uses the pattern index Django adds on PostgreSQL and keeps the
+    result exact under any collation.
+    """
+    categories = Category.objects.filter(normalized_name__gte=query,
+                                         normalized_name__startswith=query)
+    if ord(query[-1]) < sys.maxunicode:
+        upper = query[:-1] + chr(ord(query[-1]) + 1)
+        categories = categories.filter(normalized_name__lt=upper)
+    return (categories.order_by('normalized_name', 'pk')
+            .values('id', 'name')[:limit])
+
+
+def fetch_tree_records(trees, max_nodes):
+    if not isinstance(trees, list) or not trees:
+        raise ValidationError({'trees': 'Expected a non-empty list of '
+                                        'category trees.'})
+    records = list(islice(iter_tree_records(trees), max_nodes + 1))
+    if len(records) > max_nodes:
+        raise ValidationError({'trees': 'A batch can hold at most {} '
+                                        'categories.'.format(max_nodes)})
+    return records
+
+
+def fetch_pks(query_params, max_ids):
+    try:
+        pks = [int(pk) for pk in query_params['ids'].split(',') if pk.strip()]
+    except (KeyError, ValueError):
+        raise ParseError('"ids" must be a comma separated list of integers.')
+    if not pks or len(pks) > max_ids:
+        raise ParseError('"ids" must list 1 to {} categories.'.format(max_ids))
+    return list(OrderedDict.fromkeys(pks))
+
+
+def fetch_details(pks):
+    """Build detail payloads for many categories, in ``pks`` order, with a
+    fixed number of set-based queries. Unknown ids are skipped."""
+    Kids = Category.kids.through
+    categories = Category.objects.filter(pk__in=pks).prefetch_related(
+        Prefetch('kids', queryset=Category.objects.order_by('pk')))
+    categories = {obj.pk: obj for obj in categories}
+
+    parents = {}
+    for parent_id, kid_id in Kids.objects.filter(
+            to_category_id__in=pks).values_list('from_category_id',
+                                                'to_category_id'):
+        parents.setdefault(kid_id, set()).add(parent_id)
+    kids = {}
+    for parent_id, kid_id, name in Kids.objects.filter(
+            from_category_id__in=set().union(*parents.values())).values_list(
+                'from_category_id', 'to_category_id', 'to_category__name'):
+        kids.setdefault(parent_id, []).append({'id': kid_id, 'name': name})
+    ancestors = fetch_ancestors(categories)
+
+    details = []
+    for pk in pks:
+        obj = categories.get(pk)
+        if obj is None:
+            continue
+        siblings = {kid['id']: kid for parent_id in parents.get(pk, ())
+                    for kid in kids[parent_id] if kid['id'] != pk}
+        details.append({
+            'id': obj.pk,
+            'name': obj.name,
+            'children': [{'id': kid.pk, 'name': kid.name}
+                         for kid in obj.kids.all()],
+            'parents': ancestors.get(pk, []),
+            'siblings': [siblings[id] for id in sorted(siblings)],
+            'depth': obj.depth,
+            'children_count': obj.children_count,
+            'descendants_count': obj.descendants_count,
+        })
+    return details
+
+
+def fetch_snapshot_details(snapshot, pks):
+    """Like ``fetch_details`` but served from the in-memory snapshot;
+    categories it hasn't picked up yet are loaded from the database."""
+    details = {}
+    for pk in pks:
+        found = snapshot.detail(pk)
+        if found is not None:
+            details[pk] = found[1]
+    missing = [pk for pk in pks if pk not in details]
+    if missing:
+        details.update((data['id'], data) for data in fetch_details(missing))
+    return [details[pk] for pk in pks if pk in details]
+
+
 def fetch_parents(obj):
-    parent = obj.child_of.first()
-    if parent:
-        return [parent] + fetch_parents(parent)
-    return []
+    return fetch_ancestors([obj.pk]).get(obj.pk, [])
+
+
+def fetch_parent_ids(pk):
+    return list(Category.kids.through.objects.filter(to_category_id=pk)
+                .values_list('from_category_id', flat=True))
+
+
+def fetch_ancestors(pks):
+    """Return ``{pk: [{'id': ..., 'name': ...}, ...]}`` for many categories
+    with one recursive query, nearest parent first.
+
+    Follows the lowest-id parent at every level, as child_of.first() did.
+    MAX_DEPTH stops the walk if the kids graph ever contains a cycle.
+    """
+    pks = list(pks)
+    ancestors = {}
+    if not pks:
+        return ancestors
+    sql = ANCESTORS_SQL.format(kids=Category.kids.through._meta.db_table,
+                               category=Category._meta.db_table,
+                               origins=', '.join(['%s'] * len(pks)))
+    with connections[router.db_for_read(Category)].cursor() as cursor:
+        cursor.execute(sql, pks + [MAX_DEPTH])
+        for origin, id, name in cursor.fetchall():
+            ancestors.setdefault(origin, []).append({'id': id, 'name': name})
+    return ancestors
+
+
+def fetch_subtree(pk):
+    """Return ``(id, name, parent, depth)`` for a category and everything
+    under it, ordered by depth, using one query on the closure table."""
+    parents = (Category.kids.through.objects
+               .filter(to_category_id=OuterRef('descendant_id'))
+               .order_by('from_category_id')
+               .values('from_category_id')[:1])
+    return (CategoryClosure.objects.filter(ancestor_id=pk)
+            .annotate(parent=Subquery(parents))
+            .order_by('depth', 'descendant_id')
+            .values_list('descendant_id', 'descendant__name', 'parent',
+                         'depth'))
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'categories.timing.TimingMiddleware',
+    'categories.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,21 @@ DATABASES = {
     }
 }
 
+# Read replicas of the categories tables, e.g. copies of sqlite3.db:
+# CATEGORIES_REPLICA_DBS=/path/replica1.db,/path/replica2.db
+CATEGORIES_REPLICA_DBS = [
+    name for name in os.environ.get('CATEGORIES_REPLICA_DBS', '').split(',')
+    if name
+]
+for index, name in enumerate(CATEGORIES_REPLICA_DBS):
+    DATABASES['replica{}'.format(index)] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['categories.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -128,3 +145,66 @@ REST_FRAMEWORK = {
         # 'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
+
+
+# Build category responses from plain rows instead of serializers and
+# render them with orjson when it is installed. Output is unchanged.
+CATEGORIES_FAST_JSON = False
+
+
+# Keyset pagination of children and siblings in category details, see
+# fetch_paging() in categories/views.py.
+CATEGORIES_PAGINATION = {
+    'ENABLED': False,
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+}
+
+
+# Limits of ?depth=N nested children in category details.
+CATEGORIES_EXPANSION = {
+    'MAX_DEPTH': 5,
+    'MAX_NODES': 1000,
+}
+
+
+# Read-through cache for category details, see categories/cache.py for
+# the full list of options.
+CATEGORIES_CACHE = {
+    'ENABLED': False,
+    'LRU_SIZE': 1024,
+    'BACKEND': 'default',
+}
+
+
+# Database aliases serving category reads, see categories/routers.py.
+CATEGORIES_REPLICAS = {
+    'ALIASES': ['replica{}'.format(index)
+                for index in range(len(CATEGORIES_REPLICA_DBS))],
+    'STICKY_SECONDS': 5,
+}
+
+
+# In-memory copy of the category graph serving retrieve, batch retrieve and
+# descendants without queries, see categories/snapshot.py. Check the memory
+# it needs per worker with `./manage.py snapshot_footprint` first.
+CATEGORIES_SNAPSHOT = {
+    'ENABLED': False,
+    'REFRESH_INTERVAL': 5,
+}
+
+
+# Change feed at categories/changes/, see settled_cursor() in
+# categories/models.py.
+CATEGORIES_CHANGES = {
+    'SETTLE_SECONDS': 5,
+}
+
+
+# Group commit of concurrent creates within a worker process, see
+# categories/coalesce.py.
+CATEGORIES_WRITE_COALESCING = {
+    'ENABLED': False,
+    'MAX_WAIT_MS': 5,
+    'MAX_BATCH': 50,
+}
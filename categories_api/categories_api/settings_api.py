@@ -0,0 +1,43 @@
+"""
+API-only settings: the categories endpoints without admin, sessions,
+messages, CSRF or templates, for faster worker startup and less
+middleware per request.
+
+    DJANGO_SETTINGS_MODULE=categories_api.settings_api
+
+Compare with the full settings using `./manage.py settings_benchmark`.
+"""
+
+# pylint: disable=wildcard-import,unused-wildcard-import
+from categories_api.settings import *
+from categories_api.settings import REST_FRAMEWORK
+
+
+INSTALLED_APPS = [
+    'categories.apps.CategoriesConfig',
+]
+
+MIDDLEWARE = [
+    'categories.timing.TimingMiddleware',
+    'categories.routers.ReplicaPinningMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'categories_api.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+# Only the JSON renderer is used, so neither the browsable API's templates
+# nor translations of them are needed.
+USE_I18N = False
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    # The endpoints are public; this also keeps django.contrib.auth from
+    # being imported for request.user.
+    DEFAULT_AUTHENTICATION_CLASSES=(),
+    DEFAULT_PERMISSION_CLASSES=(),
+    UNAUTHENTICATED_USER=None,
+)
@@ -0,0 +1,8 @@
+"""categories_api URL configuration without the admin, for
+``settings_api``."""
+from django.urls import path
+from django.conf.urls import include
+
+urlpatterns = [
+    path('api/', include('categories.urls', namespace='categories-app')),
+]